@@ -1,3 +1,86 @@
-print("Success to import \"lib\"")
-from .layermap import *
-from .units import *
+import importlib
+
+# public name -> submodule, imported on first attribute access
+lazy_attrs = {
+    "LayerMapEditor":"layermap",
+    "Diagnostic":"layermap",
+    "ReloadReport":"layermap",
+    "cmdError":"layermap",
+    "optError":"layermap",
+    "mergeError":"layermap",
+    "rasterError":"layermap",
+    "err_msgs":"layermap",
+    "err_kinds":"layermap",
+    "parser_version":"layermap",
+    "Fragment":"layermap",
+    "clearFragmentCache":"layermap",
+    "UnitManager":"units",
+    "unitError":"units",
+    "available_units":"units",
+    "resistivity_dims":"units",
+    "trans_resistivity":"units",
+    "resistivity_exps":"units",
+    "genUnitTables":"units",
+    "updateUnitTables":"units",
+    "registerUnit":"units",
+    "registerPrefix":"units",
+    "Record":"layerstack",
+    "StackLayer":"layerstack",
+    "Material":"layerstack",
+    "LayerStack":"layerstack",
+    "IntervalIndex":"layerstack",
+    "PermittivityProfile":"layerstack",
+    "Finding":"layerstack",
+    "validateStack":"layerstack",
+    "finding_msgs":"layerstack",
+    "layer_types":"layerstack",
+    "material_types":"layerstack",
+    "stack_dtype":"layerstack",
+    "export_columns":"layerstack",
+    "material_dtype":"layerstack",
+    "LayerMapCache":"cache",
+    "Instrumentation":"instrument",
+    "ParsedLayerMap":"bulk",
+    "parseLayerMap":"bulk",
+    "importFiles":"bulk",
+    "iterFiles":"bulk",
+    "toEditor":"bulk",
+    "toArrow":"export",
+    "writeCSV":"export",
+    "StackWriter":"export",
+    "exportFiles":"export",
+    "exportError":"export",
+    "Snapshot":"history",
+    "StackHistory":"history",
+    "historyError":"history",
+    "diffStacks":"diff",
+    "StackDiff":"diff",
+    "EntryChange":"diff",
+    "diff_fields":"diff",
+    "StackSweep":"sweep",
+    "StackVariants":"sweep",
+    "sweep_params":"sweep",
+    "sweepError":"sweep",
+    "MaterialGrid":"matmodel",
+    "evalMaterials":"matmodel",
+    "StackStore":"service",
+    "StackService":"service",
+    "StackClient":"service",
+    "serviceError":"service",
+}
+submodules = ["layermap", "units", "layerstack", "cache", "bulk", "sweep", "instrument", "export", "history", "diff", "service", "matmodel", "benchmark"]
+
+__all__ = list(lazy_attrs.keys())
+
+def __getattr__(name):
+    if name in lazy_attrs:
+        val = getattr(importlib.import_module(f".{lazy_attrs[name]}", __name__), name)
+    elif name in submodules:
+        val = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = val
+    return val
+
+def __dir__():
+    return sorted(set(globals().keys())|set(lazy_attrs.keys())|set(submodules))
@@ -0,0 +1,544 @@
+import copy
+import asyncio
+import io
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import time
+import numpy as np
+from . import units
+from . import layermap
+from . import layerstack
+from . import bulk
+from . import export
+from . import history
+from . import service
+
+def timeit(func, nIter=10000):
+    t0 = time.perf_counter()
+    for _ in range(nIter):
+        func()
+    return (time.perf_counter()-t0)/nIter
+
+def bestOf(func, nIter=1, repeat=5):
+    # least disturbed of several runs, what the suite and baselines record
+    return min(timeit(func, nIter) for _ in range(repeat))
+
+def inflateUnits(nDims):
+    tables = copy.deepcopy(units.available_units)
+    for i in range(nDims):
+        tables['physical_quantity'][f'bench{i}'] = f'bq{i}'
+    return tables
+
+def benchImportTime(budget=0.05, editorBudget=0.05, nIter=5):
+    # fresh interpreter per run; numpy is imported beforehand since the budget
+    # is for this package itself. The bare import loads no submodule, so the
+    # editor classes are imported and timed too; neither may pull in
+    # matplotlib, the modules only some editor methods need, or print
+    pkgName = __name__.rpartition('.')[0]
+    deferred = ["matplotlib", "hashlib"]+[f"{pkgName}.{mod}" for mod in ["history","diff","matmodel"]]
+    code = (
+        "import sys,time,json,numpy;"
+        "t=time.perf_counter();"
+        f"import {pkgName};"
+        "t1=time.perf_counter();"
+        f"from {pkgName} import LayerMapEditor, UnitManager;"
+        "t2=time.perf_counter();"
+        f"print(json.dumps([t1-t, t2-t1, [mod for mod in {deferred!r} if mod in sys.modules]]))")
+    parentDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times, editorTimes, loaded, quiet = ([], [], set(), True)
+    for _ in range(nIter):
+        proc = subprocess.run([sys.executable, "-c", code], cwd=parentDir, capture_output=True, text=True, check=True)
+        t, tEditor, runLoaded = json.loads(proc.stdout.splitlines()[-1])
+        times.append(t)
+        editorTimes.append(tEditor)
+        loaded.update(runLoaded)
+        quiet = quiet and len(proc.stdout.splitlines())==1
+    ok = min(times)<=budget and min(editorTimes)<=editorBudget and not loaded and quiet
+    return {"sec":min(times), "editorSec":min(editorTimes), "budget":budget, "editorBudget":editorBudget, "ok":ok,
+        "matplotlib":"matplotlib" in loaded, "loaded":sorted(loaded)}
+
+def benchUnitLookup(sizes=(0,10,100), nIter=10000):
+    results = []
+    orgUnits = units.available_units
+    try:
+        for nDims in sizes:
+            units.available_units = inflateUnits(nDims)
+            units.updateUnitTables()
+            um = units.UnitManager()
+            numUnits = len(um.unitIndex)
+            results.append({
+                "numUnits":numUnits,
+                "isValid":timeit(lambda: um.isValid("nm"), nIter),
+                "getUnitVal":timeit(lambda: um.getUnitVal("nm"), nIter),
+                "getDimName":timeit(lambda: um.getDimName("nm"), nIter),
+                "getBaseUnit":timeit(lambda: um.getBaseUnit("nm"), nIter)})
+    finally:
+        units.available_units = orgUnits
+        units.updateUnitTables()
+    return results
+
+def benchUnitManagerInit(nIter=1000):
+    # "perInstance" replays the table generation every UnitManager used to run
+    return {
+        "perInstance":timeit(lambda: (units.UnitManager(), units.genUnitTables(units.available_units)), nIter),
+        "shared":timeit(units.UnitManager, nIter)}
+
+def genLayermap(fileName, nLines, mix=None, seed=0, model=False):
+    # dielectric / metal / via blocks with a few unit-qualified and keyed
+    # options; mix ({"layer":w, "conductor":w, "via":w}) instead draws every
+    # command at random with those weights. Either way the stack is valid:
+    # metals (0.205um with bias) sit on the last dielectric only when it
+    # starts at least 0.25um above the previous metal, else a dielectric is
+    # written instead, and vias join the two latest metals, bottom to top.
+    # model adds tcr to metals/vias and a dispersion reference to the IMDs
+    with open(fileName, mode='w') as f:
+        f.write("assume length um\nassume conductivity S/m\n")
+        if mix is not None:
+            rng = random.Random(seed)
+            cmds, weights = zip(*mix.items())
+            conds = []
+            top, lastBase, condBase = (0.0, 0.0, None)
+            for i in range(nLines-2):
+                cmd = rng.choices(cmds, weights)[0]
+                if cmd=="via" and len(conds)>=2:
+                    f.write(f"via V{i} {conds[-2]} {conds[-1]} 2.0e7 S/m\n")
+                elif cmd=="conductor" and (condBase is None or lastBase-condBase>=0.25):
+                    f.write(f"conductor M{i} 0.2 um 0.0{i%9+1} ohm/sq -o 0.01 -b 0.005 um\n")
+                    conds.append(f"M{i}")
+                    condBase = lastBase
+                else:
+                    f.write(f"layer IMD{i} 0.{i%9+1} 3.{i%7}\n")
+                    top, lastBase = (top+(i%9+1)/10, top)
+            return
+        imd, tcr = (" -t 0.02 -fr 1 GHz", " -tc 3.9e-3") if model else ("", "")
+        for i in range((nLines-2)//4+1):
+            f.write(f"layer IMD{i} {0.3+(i%9)/10:.1f} 3.{i%7}{imd}\n")
+            f.write(f"layer ILD{i} -h 50 nm -d 4.2 -t 0.01\n")
+            f.write(f"conductor M{i} 0.2 um 0.0{i%9+1} ohm/sq -o 0.01 -b 0.005 um{tcr}\n")
+            if i>0:
+                f.write(f"via V{i} M{i-1} M{i} 2.0e7 S/m{tcr}\n")
+            else:
+                f.write("# first metal has no via below\n")
+
+def genEditor(nLines, mix=None, seed=0, model=False):
+    fd, fileName = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        genLayermap(fileName, nLines, mix, seed, model)
+        lme = layermap.LayerMapEditor(fileName)
+        assert not lme.findings, f"invalid generated stack: {lme.findings[0]}"
+        return lme
+    finally:
+        os.remove(fileName)
+
+def benchImportFile(nLines=100000):
+    fd, fileName = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        genLayermap(fileName, nLines)
+        lme = layermap.LayerMapEditor(fileName)
+        t = timeit(lambda: lme.importFile(fileName), 3)
+    finally:
+        os.remove(fileName)
+    return {"lines":nLines, "sec":t, "linesPerSec":nLines/t}
+
+def benchRenderStack(nLines=1000, format="png", labels=True, mix=None, budget=0.8):
+    # labelled render of a generated stack; mix={"layer":1} is all
+    # dielectrics, the tallest figure per entry
+    lme = genEditor(nLines, mix)
+    t = bestOf(lambda: lme.renderStack(io.BytesIO(), format=format, labels=labels), 1, 3)
+    return {"layers":len(lme.layerData.stack), "format":format, "labels":labels, "sec":t, "budget":budget, "ok":t<=budget}
+
+def benchRasterizeStack(nLines=1000, nz=4000, nx=1000):
+    fd, fileName = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        genLayermap(fileName, nLines)
+        lme = layermap.LayerMapEditor(fileName)
+    finally:
+        os.remove(fileName)
+    zTop = max(lData.z1 for lData in lme.layerData.stack.values())
+    z = np.linspace(0, zTop, nz)
+    x = np.linspace(0, 2*zTop, nx)
+    t = timeit(lambda: lme.rasterizeStack(z, x), 3)
+    return {"layers":len(lme.layerData.stack), "points":nz*nx, "sec":t}
+
+def benchBulkImport(nFiles=32, nLines=5000, workers=(1,2,4,8)):
+    tmpDir = tempfile.mkdtemp()
+    try:
+        for i in range(nFiles):
+            genLayermap(os.path.join(tmpDir, f"layermap{i}.txt"), nLines)
+        pattern = os.path.join(tmpDir, "*.txt")
+        results = []
+        for nWorkers in workers:
+            t = timeit(lambda: bulk.importFiles(pattern, workers=nWorkers, chunksize=max(1,nFiles//(4*nWorkers))), 1)
+            results.append({"workers":nWorkers, "sec":t, "speedup":results[0]["sec"]/t if results else 1.0})
+    finally:
+        for name in os.listdir(tmpDir):
+            os.remove(os.path.join(tmpDir, name))
+        os.rmdir(tmpDir)
+    return results
+
+def benchTransArgs(nIter=10000):
+    lme = layermap.LayerMapEditor(None)
+    args = "M1 0.2 um 0.05 ohm/sq -o 0.01 -b 0.005 um".split()
+    return {"sec":bestOf(lambda: lme.transArgs("conductor", args), nIter)}
+
+def benchUnitConv(nIter=10000, size=100000):
+    um = units.UnitManager()
+    val = np.linspace(1, 2, size)
+    h = np.full(size, 0.2e-6)
+    plan = um.genResistivityPlan("ohm/sq", "S/m", "m")
+    return {
+        "convUnit":bestOf(lambda: um.convUnit(val=1.0, unit1="nm", unit2="um"), nIter),
+        "convUnitArr":bestOf(lambda: um.convUnitArr(val, unit1="nm", unit2="um"), 10),
+        "resistivityPlan":bestOf(lambda: plan(h, val), 10),
+        "size":size}
+
+def benchMergeChain(nLines=1000):
+    # merges every IMD/ILD pair one mergeLayers call at a time
+    lme = genEditor(nLines)
+    orgLayerData = lme.layerData
+    pairs = [(f"IMD{i}", f"ILD{i}", f"D{i}") for i in range((nLines-2)//4+1)]
+    def mergeChain():
+        lme.layerData = orgLayerData
+        for pair in pairs:
+            lme.mergeLayers(*pair)
+    t = bestOf(mergeChain, 1, 3)
+    lme.layerData = orgLayerData
+    return {"merges":len(pairs), "sec":t}
+
+def benchDelUnusedMat(nLines=1000):
+    lme = genEditor(nLines)
+    return {"sec":bestOf(lambda: lme.delUnusedMat(overWrite=False), 10)}
+
+def benchChangeMatCond(nLines=1000):
+    # a round trip keeps the editor in its starting unit between runs
+    lme = genEditor(nLines)
+    def roundTrip():
+        lme.changeMatCond("ohm*m")
+        lme.changeMatCond("S/m")
+    return {"sec":bestOf(roundTrip, 1)/2}
+
+def benchPlotStack(nLines=200):
+    # plt.show() is a no-op on Agg, so this times building the figure
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    lme = genEditor(nLines)
+    def plot():
+        lme.plotStack()
+        plt.close("all")
+    return {"layers":len(lme.layerData.stack), "sec":bestOf(plot, 1, 3)}
+
+def benchImportMix(nLines, mix=None, seed=0):
+    fd, fileName = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        genLayermap(fileName, nLines, mix, seed)
+        lme = layermap.LayerMapEditor(None)
+        t = bestOf(lambda: lme.importFile(fileName, verbose=False), 1, 3 if nLines<=10000 else 1)
+    finally:
+        os.remove(fileName)
+    return {"lines":nLines, "sec":t}
+
+def benchInstrumentation(nLines=10000):
+    # importFile with instrumentation detached vs attached
+    fd, fileName = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        genLayermap(fileName, nLines)
+        lme = layermap.LayerMapEditor(None)
+        off = bestOf(lambda: lme.importFile(fileName, verbose=False), 1, 3)
+        with lme.instrumented() as inst:
+            on = bestOf(lambda: lme.importFile(fileName, verbose=False), 1, 3)
+    finally:
+        os.remove(fileName)
+    return {"lines":nLines, "off":off, "on":on, "counters":inst.counters}
+
+def benchValidate(nLines=10000):
+    lme = genEditor(nLines)
+    return {"entries":len(lme.layerData.stack), "findings":len(lme.findings), "sec":bestOf(lme.validateStack, 1)}
+
+def benchExport(nLines=100000):
+    # column building vs writing them out as csv
+    lme = genEditor(nLines)
+    t = bestOf(lme.layerData.toColumns, 1)
+    tCSV = bestOf(lambda: export.writeCSV(lme.layerData, io.StringIO()), 1, 3)
+    return {"entries":len(lme.layerData.stack), "columns":t, "csv":tCSV}
+
+def benchHistory(nLines=700, nVariants=100):
+    # memory of nVariants one-merge what-if stacks kept as LayerStack copies
+    # vs as snapshots sharing the base
+    lme = genEditor(nLines)
+    base = lme.layerData
+    merges = [(f"IMD{i}", f"ILD{i}", f"D{i}") for i in range(nVariants)]
+    res = {"entries":len(base.stack), "variants":nVariants}
+    for kind in ["copies","snapshots"]:
+        root = history.Snapshot.fromLayerStack(base)
+        tracemalloc.start()
+        mem0 = tracemalloc.get_traced_memory()[0]
+        kept = []
+        for merge in merges:
+            layerData = lme.mergeLayersBatch([merge], layerData=base, overWrite=False)
+            kept.append(layerData if kind=="copies" else history.Snapshot.fromLayerStack(layerData, root))
+        res[kind] = tracemalloc.get_traced_memory()[0]-mem0
+        tracemalloc.stop()
+    return res
+
+def benchUndo(nLines=100000, nEdits=3):
+    # history undo+redo of one merge each, over cached stacks (the last
+    # maxCached versions) vs rebuilt from keyframe and delta on every step
+    lme = genEditor(nLines)
+    hist = lme.trackHistory()
+    for i in range(nEdits):
+        lme.mergeLayers(f"IMD{i}", f"ILD{i}", f"D{i}")
+    def step(cold):
+        if cold:
+            hist.cache.clear()
+        hist.undo()
+        if cold:
+            hist.cache.clear()
+        hist.redo()
+    return {"entries":len(lme.layerData.stack), "cached":bestOf(lambda: step(False), 1)/2, "rebuilt":bestOf(lambda: step(True), 1)/2}
+
+def benchFragments(nVariants=50, nLines=5000):
+    # a family of variants sharing one included base, parsed with the
+    # fragment cache cleared before every file vs kept warm
+    tmpDir = tempfile.mkdtemp()
+    try:
+        genLayermap(os.path.join(tmpDir, "base.txt"), nLines)
+        for i in range(nVariants):
+            with open(os.path.join(tmpDir, f"variant{i}.txt"), mode='w') as f:
+                f.write(f"include base.txt\nlayer TOP{i} 1.{i%9} 4.0\nconductor MTOP{i} 2.0 um 0.01 ohm/sq\n")
+        files = [os.path.join(tmpDir, f"variant{i}.txt") for i in range(nVariants)]
+        def parse(cold):
+            for fileName in files:
+                if cold:
+                    layermap.clearFragmentCache()
+                layermap.LayerMapEditor(None).importFile(fileName, verbose=False)
+        res = {"variants":nVariants, "lines":nLines, "cold":bestOf(lambda: parse(True), 1, 1)}
+        layermap.clearFragmentCache()
+        res["warm"] = bestOf(lambda: parse(False), 1, 1)
+    finally:
+        for name in os.listdir(tmpDir):
+            os.remove(os.path.join(tmpDir, name))
+        os.rmdir(tmpDir)
+    return res
+
+def benchDiff(nLines=100000):
+    # a merged copy (records shared) vs an independently parsed equal stack
+    lme = genEditor(nLines)
+    other = genEditor(nLines)
+    merged = lme.mergeLayers("IMD5", "ILD5", "D5", overWrite=False)
+    return {
+        "entries":len(lme.layerData.stack),
+        "shared":bestOf(lambda: lme.diffStack(merged), 1, 3),
+        "parsed":bestOf(lambda: lme.diffStack(other), 1, 3)}
+
+def benchOverlaps(nLines=100000, nQueries=1000, seed=0):
+    # overlap queries on a generated stack, and on the same stack plus one
+    # via spanning all of it (which contains every other entry)
+    lme = genEditor(nLines)
+    stack = lme.layerData.stack
+    names = list(stack.keys())
+    z0 = [lData.z0 for lData in stack.values()]
+    z1 = [lData.z1 for lData in stack.values()]
+    rng = random.Random(seed)
+    queries = [rng.uniform(min(z0), max(z1)) for _ in range(nQueries)]
+    res = {"entries":len(names)}
+    for key,extra in [("plain",[]), ("fullVia",[("VFULL", min(z0), max(z1))])]:
+        index = layerstack.IntervalIndex(names+[e[0] for e in extra], z0+[e[1] for e in extra], z1+[e[2] for e in extra])
+        res[key] = bestOf(lambda: [index.queryOverlaps(z, z+0.1) for z in queries], 1, 3)/nQueries
+    return res
+
+def benchService(nLines=10000, nClients=16, nRequests=500, seed=0):
+    # service in its own interpreter on a unix socket, nClients connections
+    # each sending nRequests queries (layer, overlaps, convert,
+    # effPermittivity at random) one after another
+    pkgName = __name__.rpartition('.')[0]
+    parentDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmpDir = tempfile.mkdtemp()
+    fileName = os.path.join(tmpDir, "layermap.txt")
+    sockName = os.path.join(tmpDir, "service.sock")
+    genLayermap(fileName, nLines)
+    proc = subprocess.Popen([sys.executable, "-m", f"{pkgName}.service", "--socket", sockName, "--watch", "0", "--load", "bench", fileName],
+        cwd=parentDir, stderr=subprocess.PIPE, text=True)
+    try:
+        proc.stderr.readline()
+        rng = random.Random(seed)
+        lNames = [f"M{i}" for i in range((nLines-2)//4+1)]
+        zMax = (nLines//4)*0.5
+        def genQuery():
+            kind = rng.randrange(4)
+            z0 = rng.uniform(0, zMax)
+            if kind==0:
+                return ("layer", {"key":"bench", "name":rng.choice(lNames)})
+            if kind==1:
+                return ("overlaps", {"key":"bench", "z0":z0, "z1":z0+1.0})
+            if kind==2:
+                return ("convert", {"val":rng.random(), "unit1":"um", "unit2":"nm"})
+            return ("effPermittivity", {"key":"bench", "z0":z0, "z1":z0+2.0})
+        queries = [[genQuery() for _ in range(nRequests)] for _ in range(nClients)]
+
+        async def runClient(queries, latencies):
+            client = await service.StackClient.connect(sockName)
+            for method,params in queries:
+                t0 = time.perf_counter()
+                await client.call(method, **params)
+                latencies.append(time.perf_counter()-t0)
+            await client.close()
+
+        async def run():
+            latencies = []
+            t0 = time.perf_counter()
+            await asyncio.gather(*(runClient(q, latencies) for q in queries))
+            return time.perf_counter()-t0, latencies
+        sec, latencies = asyncio.run(run())
+    finally:
+        proc.terminate()
+        proc.wait()
+        for name in os.listdir(tmpDir):
+            os.remove(os.path.join(tmpDir, name))
+        os.rmdir(tmpDir)
+    return {
+        "clients":nClients,
+        "requests":len(latencies),
+        "sec":sec,
+        "perSec":len(latencies)/sec,
+        "p50":float(np.percentile(latencies, 50)),
+        "p99":float(np.percentile(latencies, 99))}
+
+def benchMaterialGrid(nLines=1000, nTemps=50, nFreqs=300):
+    # every material of the stack over a temperature x frequency grid in one call
+    lme = genEditor(nLines, model=True)
+    temperature = np.linspace(233.15, 398.15, nTemps)
+    frequency = np.logspace(6, 11, nFreqs)
+    return {
+        "materials":len(lme.layerData.materials),
+        "points":len(lme.layerData.materials)*nTemps*nFreqs,
+        "sec":bestOf(lambda: lme.evalMaterials(temperature, frequency), 1, 3)}
+
+def runSuite(sizes=(10,1000,10000,100000), mix=None, seed=0, plot=True, repeat=3):
+    # flat {"bench[param]": seconds}, each the best of repeat passes over the
+    # whole suite, plus the environment it was measured in
+    res = {}
+    for _ in range(repeat):
+        for name,sec in runSuitePass(sizes, mix, seed, plot).items():
+            res[name] = min(sec, res.get(name, sec))
+    return {
+        "meta":{
+            "python":platform.python_version(),
+            "numpy":np.__version__,
+            "machine":platform.machine(),
+            "parser_version":layermap.parser_version,
+            "mix":mix,
+            "seed":seed,
+            "repeat":repeat},
+        "results":res}
+
+def runSuitePass(sizes, mix, seed, plot):
+    res = {}
+    for nLines in sizes:
+        res[f"importFile[{nLines}]"] = benchImportMix(nLines, mix, seed)["sec"]
+    res["transArgs"] = benchTransArgs()["sec"]
+    for k,v in benchUnitConv().items():
+        if k!="size":
+            res[f"units.{k}"] = v
+    for k,v in benchUnitLookup(sizes=(0,))[0].items():
+        if k!="numUnits":
+            res[f"units.{k}"] = v
+    mergeSize = min(max(sizes), 10000)
+    res[f"mergeLayers[{mergeSize}]"] = benchMergeChain(mergeSize)["sec"]
+    res[f"delUnusedMat[{max(sizes)}]"] = benchDelUnusedMat(max(sizes))["sec"]
+    res[f"changeMatCond[{max(sizes)}]"] = benchChangeMatCond(max(sizes))["sec"]
+    res[f"validateStack[{max(sizes)}]"] = benchValidate(max(sizes))["sec"]
+    if plot:
+        res["plotStack[200]"] = benchPlotStack(200)["sec"]
+    return res
+
+def compareBaseline(results, baseline, tolerance=0.25, floor=1e-3):
+    # benchmarks slower than baseline*(1+tolerance) and by more than floor
+    # seconds, so sub-millisecond timings cannot fail on noise alone; names
+    # missing on either side are skipped
+    regressions = []
+    for name,sec in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is not None and sec>base*(1+tolerance) and sec-base>floor:
+            regressions.append({"name":name, "baseline":base, "sec":sec, "ratio":sec/base})
+    return regressions
+
+def runFeatureReport():
+    res = benchImportTime()
+    print(f'import: {res["sec"]*1e3:.1f}ms (budget {res["budget"]*1e3:.0f}ms), LayerMapEditor/UnitManager {res["editorSec"]*1e3:.1f}ms (budget {res["editorBudget"]*1e3:.0f}ms), eagerly loaded: {", ".join(res["loaded"]) or "none"} '+('OK' if res["ok"] else 'OVER BUDGET'))
+    for nLines,format in [(1000,"png"), (1000,"svg"), (200,"png")]:
+        res = benchRenderStack(nLines, format=format)
+        print(f'renderStack: {res["layers"]} layers to {res["format"]} in {res["sec"]:.3f}s (budget {res["budget"]:.1f}s) '+('OK' if res["ok"] else 'OVER BUDGET'))
+    res = benchRenderStack(1002, mix={"layer":1})
+    print(f'renderStack: {res["layers"]} dielectrics to png in {res["sec"]:.3f}s (budget {res["budget"]:.1f}s) '+('OK' if res["ok"] else 'OVER BUDGET'))
+    res = benchRasterizeStack()
+    print(f'rasterizeStack: {res["layers"]} layers onto {res["points"]} points in {res["sec"]:.3f}s')
+    for res in benchBulkImport():
+        print(f'importFiles: {res["workers"]} workers {res["sec"]:.3f}s (x{res["speedup"]:.2f}, {os.cpu_count()} cpus)')
+    res = benchImportFile()
+    print(f'importFile: {res["lines"]} lines in {res["sec"]:.3f}s ({res["linesPerSec"]:.0f} lines/s)')
+    res = benchInstrumentation()
+    print(f'instrumentation: importFile {res["lines"]} lines {res["off"]:.3f}s detached, {res["on"]:.3f}s attached')
+    res = benchExport()
+    print(f'export: {res["entries"]} entries to columns {res["columns"]:.3f}s, to csv {res["csv"]:.3f}s')
+    res = benchHistory()
+    print(f'history: {res["variants"]} variants of {res["entries"]} entries, copies {res["copies"]/1e6:.2f}MB, snapshots {res["snapshots"]/1e6:.2f}MB')
+    res = benchUndo()
+    print(f'undo/redo: {res["entries"]} entries, cached {res["cached"]*1e3:.2f}ms, rebuilt {res["rebuilt"]*1e3:.2f}ms per step')
+    res = benchFragments()
+    print(f'fragments: {res["variants"]} variants of a {res["lines"]} line base, cold {res["cold"]:.3f}s, shared {res["warm"]:.3f}s')
+    res = benchDiff()
+    print(f'diffStack: {res["entries"]} entries, shared records {res["shared"]:.3f}s, separately parsed {res["parsed"]:.3f}s')
+    res = benchOverlaps()
+    print(f'overlaps: {res["entries"]} entries, {res["plain"]*1e6:.1f}us per query, {res["fullVia"]*1e6:.1f}us with a full height via')
+    res = benchService()
+    print(f'service: {res["clients"]} clients {res["requests"]} requests, {res["perSec"]:.0f} req/s, p50 {res["p50"]*1e3:.2f}ms, p99 {res["p99"]*1e3:.2f}ms')
+    res = benchMaterialGrid()
+    print(f'evalMaterials: {res["materials"]} materials, {res["points"]/1e6:.1f}M points in {res["sec"]:.3f}s')
+    res = benchUnitManagerInit()
+    print(f'UnitManager(): per-instance tables {res["perInstance"]*1e6:.1f}us, shared tables {res["shared"]*1e6:.3f}us')
+    for res in benchUnitLookup():
+        print(f'{res["numUnits"]:6d} units: '+', '.join(f'{k} {v*1e9:.1f}ns' for k,v in res.items() if k!="numUnits"))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description="layermap benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10,1000,10000,100000])
+    parser.add_argument("--mix", type=float, nargs=3, metavar=("LAYER","CONDUCTOR","VIA"), help="random command mix weights")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-plot", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail when slower than this saved result")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--floor", type=float, default=1e-3, help="seconds a benchmark must also lose to count as a regression")
+    parser.add_argument("--repeat", type=int, default=3, help="suite passes, each benchmark keeps its best")
+    parser.add_argument("--features", action="store_true", help="print the per-feature report instead")
+    args = parser.parse_args()
+    if args.features:
+        runFeatureReport()
+        sys.exit(0)
+
+    mix = dict(zip(["layer","conductor","via"], args.mix)) if args.mix else None
+    results = runSuite(args.sizes, mix, args.seed, plot=not args.no_plot, repeat=args.repeat)
+    if args.json:
+        with open(args.json, mode='w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        print(json.dumps(results, indent=1))
+    if args.baseline:
+        with open(args.baseline, mode='r') as f:
+            regressions = compareBaseline(results, json.load(f), args.tolerance, args.floor)
+        for reg in regressions:
+            print(f'REGRESSION {reg["name"]}: {reg["sec"]:.3g}s vs {reg["baseline"]:.3g}s (x{reg["ratio"]:.2f})', file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,43 @@
+import glob
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from . import layermap
+
+# parsed layermap in a compact picklable form: editor state as plain
+# python values plus the two structured column tables
+ParsedLayerMap = namedtuple("ParsedLayerMap", ["fileName","meta","stackArr","matArr","error"])
+
+def parseLayerMap(fileName, matPrefix='T65_', defLen="m", defCond="S/m"):
+    lme = layermap.LayerMapEditor(None, defLen=defLen, defCond=defCond)
+    try:
+        lme.importFile(fileName, matPrefix=matPrefix, verbose=False)
+        meta, stackArr, matArr = lme.dumpState()
+    except Exception as e:
+        meta = {"diagnostics":[list(diag) for diag in lme.diagnostics]}
+        return ParsedLayerMap(fileName, meta, None, None, f"{type(e).__name__}: {e}")
+    return ParsedLayerMap(fileName, meta, stackArr, matArr, None)
+
+def parseLayerMapArgs(args):
+    return parseLayerMap(*args)
+
+def iterFiles(files, workers=None, chunksize=1, matPrefix='T65_', defLen="m", defCond="S/m"):
+    # files is a list of paths or a glob pattern; results are yielded in
+    # order as they are consumed. A file that fails to parse comes back with
+    # error set instead of aborting the batch
+    if isinstance(files, str):
+        files = sorted(glob.glob(files, recursive=True))
+    args = [(fileName, matPrefix, defLen, defCond) for fileName in files]
+    if workers==1:
+        for arg in args:
+            yield parseLayerMapArgs(arg)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parseLayerMapArgs, args, chunksize=chunksize)
+
+def importFiles(files, workers=None, chunksize=1, matPrefix='T65_', defLen="m", defCond="S/m"):
+    return list(iterFiles(files, workers, chunksize, matPrefix, defLen, defCond))
+
+def toEditor(parsed, defLen="m", defCond="S/m"):
+    lme = layermap.LayerMapEditor(None, defLen=defLen, defCond=defCond)
+    lme.loadState(parsed.meta, parsed.stackArr, parsed.matArr)
+    return lme
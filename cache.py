@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+class LayerMapCache():
+    # one directory per entry: stack.npy / materials.npy hold the numeric
+    # columns (memory-mappable), meta.json the names and editor state
+    def __init__(self, cacheDir, maxBytes=None, maxAge=None):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def genKey(self, content, *args):
+        h = hashlib.sha256(content)
+        for arg in args:
+            h.update(b"\0"+str(arg).encode())
+        return h.hexdigest()
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def load(self, key, mmap_mode="r"):
+        entryDir = self.getEntryDir(key)
+        try:
+            with open(os.path.join(entryDir, "meta.json"), mode='r') as f:
+                meta = json.load(f)
+            stackArr = np.load(os.path.join(entryDir, "stack.npy"), mmap_mode=mmap_mode)
+            matArr = np.load(os.path.join(entryDir, "materials.npy"), mmap_mode=mmap_mode)
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        os.utime(entryDir, (now, now))
+        return meta, stackArr, matArr
+
+    def store(self, key, meta, stackArr, matArr):
+        entryDir = self.getEntryDir(key)
+        if os.path.isdir(entryDir):
+            return
+        # build the entry aside and rename it in, so readers never see a partial one
+        tmpDir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cacheDir)
+        try:
+            np.save(os.path.join(tmpDir, "stack.npy"), stackArr)
+            np.save(os.path.join(tmpDir, "materials.npy"), matArr)
+            with open(os.path.join(tmpDir, "meta.json"), mode='w') as f:
+                json.dump(meta, f)
+            os.rename(tmpDir, entryDir)
+        except OSError:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            return
+        self.evict()
+
+    def getEntries(self):
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir, name)
+            if name.startswith(".tmp-") or not os.path.isdir(entryDir):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entryDir))
+                entries.append((os.stat(entryDir).st_mtime, size, entryDir))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def evict(self):
+        # drop entries older than maxAge, then least recently used ones above maxBytes
+        entries = self.getEntries()
+        if self.maxAge is not None:
+            limit = time.time()-self.maxAge
+            for entry in [entry for entry in entries if entry[0]<limit]:
+                shutil.rmtree(entry[2], ignore_errors=True)
+                entries.remove(entry)
+        if self.maxBytes is not None:
+            total = sum(entry[1] for entry in entries)
+            for entry in list(entries):
+                if total<=self.maxBytes:
+                    break
+                shutil.rmtree(entry[2], ignore_errors=True)
+                total -= entry[1]
+
+    def clear(self):
+        for entry in self.getEntries():
+            shutil.rmtree(entry[2], ignore_errors=True)
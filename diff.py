@@ -0,0 +1,139 @@
+import math
+from collections import namedtuple
+from . import layerstack
+
+# Define Diff Fields ###########################################################
+# compared per entry; eps/sigma/tandel and the tcr/dispersion fields come
+# from its material. Material names are not compared since they follow the
+# entry name
+diff_fields = ["type","height","z0","z1","offset","origin","connects","eps","sigma","tandel","tcr","tcr2","tempRef","freqRef"]
+num_fields = ["height","z0","z1","offset","origin","eps","sigma","tandel","tcr","tcr2","tempRef","freqRef"]
+
+EntryChange = namedtuple("EntryChange", ["name","newName","changes"])
+
+class StackDiff(namedtuple("StackDiff", ["inserted","removed","renamed","modified","unchanged"])):
+    # inserted/removed: entry names only in the new/old stack, renamed:
+    # (old, new) pairs, modified: EntryChange with changes {field:(old, new)}
+    # for entries matched by name or rename, unchanged: count of the matched
+    # entries without changes
+    __slots__ = ()
+
+    @property
+    def identical(self):
+        return not (self.inserted or self.removed or self.renamed or self.modified)
+
+    def __str__(self):
+        lines = [f"+ {lName}" for lName in self.inserted]+[f"- {lName}" for lName in self.removed]
+        lines += [f"~ {old} -> {new}" for old,new in self.renamed]
+        for change in self.modified:
+            name = change.name if change.name==change.newName else f"{change.name} -> {change.newName}"
+            lines += [f"* {name}.{field}: {old} -> {new}" for field,(old,new) in change.changes.items()]
+        return "\n".join(lines)
+
+def getFields(lData, mData):
+    # values in diff_fields order
+    if mData is None:
+        return (lData.type, lData.height, lData.z0, lData.z1, lData.offset, lData.origin, lData.connects, None, None, None, None, None, None, None)
+    return (lData.type, lData.height, lData.z0, lData.z1, lData.offset, lData.origin, lData.connects, mData.constant, mData.conductivity, mData.tandel,
+        mData.tcr, mData.tcr2, mData.tempRef, mData.freqRef)
+
+def quantize(val, digits):
+    # values equal to digits significant digits match alike; nan is one value
+    if val is None or type(val) is str:
+        return val
+    if val!=val:
+        return "nan"
+    return float(f"{val:.{digits}g}")
+
+def contentKey(fields):
+    # exact and name independent, so equal keys of differently named entries
+    # mark rename candidates; nan (whose hash is per object) is normalized
+    return tuple("nan" if val!=val else val for val in fields)
+
+def isClose(a, b, rtol, atol):
+    if a is None or b is None:
+        return a is b
+    if a!=a or b!=b:
+        return a!=a and b!=b
+    return abs(a-b)<=atol+rtol*max(abs(a), abs(b))
+
+def compareFields(fieldsA, fieldsB, renames, rtol, atol):
+    changes = {}
+    for field,a,b in zip(diff_fields, fieldsA, fieldsB):
+        if field=="connects":
+            if (tuple(renames.get(cName, cName) for cName in a) if a else a)!=(tuple(b) if b else b):
+                changes[field] = (a, b)
+        elif field in num_fields:
+            if not isClose(a, b, rtol, atol):
+                changes[field] = (a, b)
+        elif a!=b:
+            changes[field] = (a, b)
+    return changes
+
+def diffStacks(layerDataA, layerDataB, rtol=1e-9, atol=0.0):
+    # entries matched by name, then the unmatched ones as renames: first by
+    # content key, then by type and position (to rtol). Records shared between
+    # the two stacks are skipped by identity and exactly equal ones by one
+    # tuple comparison, so only the changed entries are compared with
+    # tolerances and only unmatched ones are hashed
+    layerDataA = layerstack.LayerStack.fromDict(layerDataA)
+    layerDataB = layerstack.LayerStack.fromDict(layerDataB)
+    stackA, stackB = (layerDataA.stack, layerDataB.stack)
+    matsA, matsB = (layerDataA.materials, layerDataB.materials)
+    digits = max(1, min(17, int(-math.log10(rtol)))) if rtol>0 else 17
+
+    def getKey(lName, stack, mats):
+        lData = stack[lName]
+        return contentKey(getFields(lData, mats.get(lData.material)))
+
+    removed = [lName for lName in stackA if lName not in stackB]
+    inserted = [lName for lName in stackB if lName not in stackA]
+
+    # renames: identical content first, then same type at the same position
+    renames = {}
+    if removed and inserted:
+        byKey, byPos = ({}, {})
+        for lName in inserted:
+            byKey.setdefault(getKey(lName, stackB, matsB), []).append(lName)
+        for lName in removed:
+            cands = byKey.get(getKey(lName, stackA, matsA))
+            if cands:
+                renames[lName] = cands.pop(0)
+        taken = set(renames.values())
+        for lName in inserted:
+            if lName not in taken:
+                lData = stackB[lName]
+                byPos.setdefault((lData.type, quantize(lData.z0, digits), quantize(lData.z1, digits)), []).append(lName)
+        for lName in removed:
+            if lName not in renames:
+                lData = stackA[lName]
+                cands = byPos.get((lData.type, quantize(lData.z0, digits), quantize(lData.z1, digits)))
+                if cands:
+                    renames[lName] = cands.pop(0)
+        taken = set(renames.values())
+        removed = [lName for lName in removed if lName not in renames]
+        inserted = [lName for lName in inserted if lName not in taken]
+
+    modified = []
+    unchanged = 0
+    pairs = [(lName, lName) for lName in stackA if lName in stackB]+list(renames.items())
+    for nameA,nameB in pairs:
+        lDataA, lDataB = (stackA[nameA], stackB[nameB])
+        mDataA, mDataB = (matsA.get(lDataA.material), matsB.get(lDataB.material))
+        checkConnects = lDataA.connects and renames
+        if lDataA is lDataB and mDataA is mDataB and not checkConnects:
+            unchanged += 1
+            continue
+        # tuple equality checks identity first, so shared nan defaults match;
+        # anything else goes through the tolerant comparison
+        fieldsA = getFields(lDataA, mDataA)
+        fieldsB = getFields(lDataB, mDataB)
+        if fieldsA==fieldsB and not checkConnects:
+            unchanged += 1
+            continue
+        changes = compareFields(fieldsA, fieldsB, renames, rtol, atol)
+        if changes:
+            modified.append(EntryChange(nameA, nameB, changes))
+        else:
+            unchanged += 1
+    return StackDiff(inserted, removed, list(renames.items()), modified, unchanged)
@@ -0,0 +1,107 @@
+import csv
+import numpy as np
+from . import layerstack
+from . import bulk
+
+# pyarrow is only imported by the arrow/parquet paths; csv needs nothing
+
+def getColumns(layerData):
+    return layerstack.LayerStack.fromDict(layerData).toColumns()
+
+def toArrow(layerData, keys=None):
+    # the float64 columns are wrapped, not copied: their buffers become the
+    # arrow data buffers and nan stays a value (no validity bitmap). keys
+    # ({column:value}) are prepended as dictionary encoded constant columns
+    import pyarrow as pa
+    cols = getColumns(layerData)
+    num = len(cols["name"])
+    names, arrays = ([], [])
+    for key,val in (keys or {}).items():
+        names.append(key)
+        arrays.append(pa.DictionaryArray.from_arrays(pa.array(np.zeros(num, dtype=np.int32)), pa.array([val], type=pa.string())))
+    for name in layerstack.export_columns:
+        col = cols[name]
+        names.append(name)
+        if isinstance(col, np.ndarray):
+            arrays.append(pa.Array.from_buffers(pa.float64(), num, [None, pa.py_buffer(col)], null_count=0))
+        else:
+            arrays.append(pa.array(col, type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=names)
+
+def writeCSV(layerData, f, keys=None, header=True):
+    cols = getColumns(layerData)
+    keys = keys or {}
+    writer = csv.writer(f)
+    if header:
+        writer.writerow(list(keys.keys())+layerstack.export_columns)
+    consts = list(keys.values())
+    rowCols = [cols[name].tolist() if isinstance(cols[name], np.ndarray) else cols[name] for name in layerstack.export_columns]
+    writer.writerows(consts+list(row) for row in zip(*rowCols))
+    return len(cols["name"])
+
+class StackWriter():
+    # appends stacks one at a time to a single parquet file (one row group
+    # per stack, schema fixed by the first) or csv file, so a dataset of many
+    # stacks is written without holding them together. keyNames are leading
+    # constant columns, e.g. the source file, set on every append
+    def __init__(self, fileName, format=None, keyNames=None):
+        if format is None:
+            format = "csv" if fileName.lower().endswith(".csv") else "parquet"
+        if format not in ["parquet","csv"]:
+            raise exportError("unDefFormat", format)
+        self.fileName = fileName
+        self.format = format
+        self.keyNames = list(keyNames) if keyNames else []
+        self.writer = None
+        self.file = None
+        self.stacks = 0
+        self.rows = 0
+
+    def append(self, layerData, **keys):
+        if sorted(keys.keys())!=sorted(self.keyNames):
+            raise exportError("keyMismatch", sorted(keys.keys()), self.keyNames)
+        keys = {key:keys[key] for key in self.keyNames}
+        if self.format=="parquet":
+            table = toArrow(layerData, keys)
+            if self.writer is None:
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.fileName, table.schema)
+            self.writer.write_table(table)
+            self.rows += table.num_rows
+        else:
+            if self.file is None:
+                self.file = open(self.fileName, mode='w', newline='')
+            self.rows += writeCSV(layerData, self.file, keys, header=self.stacks==0)
+        self.stacks += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def exportFiles(files, fileName, format=None, workers=None, chunksize=1, matPrefix='T65_', defLen="m", defCond="S/m"):
+    # parse layermaps (in parallel like bulk.importFiles) and stream them into
+    # one dataset keyed by a "source" column; files that fail to parse are
+    # skipped and returned
+    failed = []
+    with StackWriter(fileName, format, ["source"]) as writer:
+        for parsed in bulk.iterFiles(files, workers, chunksize, matPrefix, defLen, defCond):
+            if parsed.error is not None:
+                failed.append(parsed)
+                continue
+            meta = parsed.meta
+            layerData = layerstack.LayerStack.fromArrays(meta["layerNames"], parsed.stackArr, meta["matNames"], parsed.matArr, dict(meta["num"]), dict(meta["unit"]))
+            writer.append(layerData, source=parsed.fileName)
+    return failed
+
+class exportError(Exception):
+    pass
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from . import layerstack
+
+# Define Stack Deltas ##########################################################
+# A delta rebuilds an ordered dict from a keyframe dict: keyframe keys in
+# "deleted" are dropped and inserts[key] (a list of (key, val)) is emitted
+# right before keyframe entry key, inserts[None] at the end. A changed value
+# is a deletion plus an insert of the same key. Values are compared by
+# identity, which is what stack records shared between copies give.
+def diffDict(kfKeys, kfPos, kfDict, newDict):
+    deleted, inserts = (set(), {})
+    p = 0
+    pending = []
+    for key,val in newDict.items():
+        if key in kfPos and kfDict[key] is val:
+            i = kfPos[key]
+            if i<p:
+                # reordered relative to the keyframe
+                return None
+            deleted.update(kfKeys[p:i])
+            if pending:
+                inserts[key] = pending
+                pending = []
+            p = i+1
+        else:
+            pending.append((key, val))
+    deleted.update(kfKeys[p:])
+    if pending:
+        inserts[None] = pending
+    return deleted, inserts
+
+def applyDict(kfDict, deleted, inserts):
+    if not deleted and not inserts:
+        return dict(kfDict)
+    ret = {}
+    for key,val in kfDict.items():
+        if key in inserts:
+            ret.update(inserts[key])
+        if key not in deleted:
+            ret[key] = val
+    ret.update(inserts.get(None, ()))
+    return ret
+
+class Keyframe():
+    # full stack and material dicts a run of snapshots is stored against
+    __slots__ = ("stack","materials","stackKeys","stackPos","matKeys","matPos")
+
+    def __init__(self, layerData):
+        self.stack = dict(layerData.stack)
+        self.materials = dict(layerData.materials)
+        self.stackKeys = list(self.stack.keys())
+        self.stackPos = {key:i for i,key in enumerate(self.stackKeys)}
+        self.matKeys = list(self.materials.keys())
+        self.matPos = {key:i for i,key in enumerate(self.matKeys)}
+
+# Define Snapshots #############################################################
+class Snapshot():
+    # immutable stack version; holds its keyframe plus the delta to it, so
+    # snapshots of one keyframe share every unchanged layer and material
+    __slots__ = ("parent","label","keyframe","stackDelta","matDelta","added","addedMat","num","unit","size")
+
+    def __init__(self, parent, label, keyframe, stackDelta, matDelta, num, unit):
+        self.parent = parent
+        self.label = label
+        self.keyframe = keyframe
+        self.stackDelta = stackDelta
+        self.matDelta = matDelta
+        self.added = {key:val for ents in stackDelta[1].values() for key,val in ents}
+        self.addedMat = {key:val for ents in matDelta[1].values() for key,val in ents}
+        self.num = dict(num)
+        self.unit = dict(unit)
+        self.size = sum(map(len, (stackDelta[0], matDelta[0], self.added, self.addedMat)))
+
+    @classmethod
+    def fromLayerStack(cls, layerData, parent=None, label=None, maxDelta=0.25):
+        # stored as a delta to the parent's keyframe unless that is out of
+        # order or larger than maxDelta of the stack, then as a new keyframe
+        layerData = layerstack.LayerStack.fromDict(layerData)
+        if parent is not None:
+            kf = parent.keyframe
+            stackDelta = diffDict(kf.stackKeys, kf.stackPos, kf.stack, layerData.stack)
+            matDelta = diffDict(kf.matKeys, kf.matPos, kf.materials, layerData.materials)
+            if stackDelta is not None and matDelta is not None:
+                size = sum(len(delta[0])+sum(map(len, delta[1].values())) for delta in (stackDelta, matDelta))
+                if size<=max(16, maxDelta*(len(kf.stack)+len(kf.materials))):
+                    return cls(parent, label, kf, stackDelta, matDelta, layerData.num, layerData.unit)
+        empty = (set(), {})
+        return cls(parent, label, Keyframe(layerData), empty, empty, layerData.num, layerData.unit)
+
+    def getLayer(self, lName, default=None):
+        if lName in self.added:
+            return self.added[lName]
+        if lName in self.stackDelta[0]:
+            return default
+        return self.keyframe.stack.get(lName, default)
+
+    def getMaterial(self, mName, default=None):
+        if mName in self.addedMat:
+            return self.addedMat[mName]
+        if mName in self.matDelta[0]:
+            return default
+        return self.keyframe.materials.get(mName, default)
+
+    def toLayerStack(self):
+        kf = self.keyframe
+        return layerstack.LayerStack(applyDict(kf.stack, *self.stackDelta), applyDict(kf.materials, *self.matDelta), dict(self.num), dict(self.unit))
+
+    def __repr__(self):
+        return f"Snapshot({self.label!r}, delta {self.size})"
+
+# Define History ###############################################################
+class StackHistory():
+    # named branches of snapshots; each branch has a head and a redo list, so
+    # moving between versions is a pointer move, but handing one out is not:
+    # callers edit the returned stack's dicts in place, so they always get a
+    # copy. Materialized LayerStacks of the last maxCached committed or
+    # visited snapshots are kept; getting one of those costs a copy of the
+    # stack/materials dicts (O(L) but C-level, records are shared, not
+    # copied), any other snapshot is first rebuilt from its keyframe and
+    # delta by applyDict, an O(L) python loop. Commits are O(L) either way
+    def __init__(self, layerData, label=None, maxDelta=0.25, maxCached=4):
+        self.maxDelta = maxDelta
+        self.maxCached = maxCached
+        self.cache = OrderedDict()
+        layerData = layerstack.LayerStack.fromDict(layerData)
+        self.heads = {"main":Snapshot.fromLayerStack(layerData, label=label)}
+        self.redos = {"main":[]}
+        self.current = "main"
+        self.cacheStack(self.head, layerData.copy())
+
+    @property
+    def head(self):
+        return self.heads[self.current]
+
+    def cacheStack(self, snapshot, layerData):
+        # keyed by id, the snapshot is kept alongside so a reused id misses
+        self.cache[id(snapshot)] = (snapshot, layerData)
+        self.cache.move_to_end(id(snapshot))
+        if len(self.cache)>self.maxCached:
+            self.cache.popitem(last=False)
+
+    def get(self, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.head
+        layerData = self.cache.get(id(snapshot))
+        if layerData is None or layerData[0] is not snapshot:
+            self.cacheStack(snapshot, snapshot.toLayerStack())
+        else:
+            self.cache.move_to_end(id(snapshot))
+        return self.cache[id(snapshot)][1].copy()
+
+    def commit(self, layerData, label=None):
+        # the committed stack is cached as well, so undo/redo over the last
+        # maxCached edits never rebuild from the keyframe
+        layerData = layerstack.LayerStack.fromDict(layerData)
+        snapshot = Snapshot.fromLayerStack(layerData, self.head, label, self.maxDelta)
+        self.heads[self.current] = snapshot
+        self.redos[self.current] = []
+        self.cacheStack(snapshot, layerData.copy())
+        return snapshot
+
+    def undo(self):
+        head = self.head
+        if head.parent is None:
+            raise historyError("noUndo", self.current)
+        self.redos[self.current].append(head)
+        self.heads[self.current] = head.parent
+        return self.get()
+
+    def redo(self):
+        if not self.redos[self.current]:
+            raise historyError("noRedo", self.current)
+        self.heads[self.current] = self.redos[self.current].pop()
+        return self.get()
+
+    def branch(self, name, snapshot=None):
+        # new branch at snapshot (default the current head), not checked out
+        if name in self.heads:
+            raise historyError("dupBranch", name)
+        self.heads[name] = snapshot if snapshot is not None else self.head
+        self.redos[name] = []
+        return self.heads[name]
+
+    def checkout(self, name):
+        if name not in self.heads:
+            raise historyError("unDefBranch", name)
+        self.current = name
+        return self.get()
+
+    def deleteBranch(self, name):
+        if name not in self.heads or name==self.current:
+            raise historyError("unDefBranch" if name not in self.heads else "curBranch", name)
+        del self.heads[name]
+        del self.redos[name]
+
+    def log(self, name=None):
+        # snapshots from the branch head back to the root
+        snapshot = self.heads[name if name is not None else self.current]
+        ret = []
+        while snapshot is not None:
+            ret.append(snapshot)
+            snapshot = snapshot.parent
+        return ret
+
+class historyError(Exception):
+    pass
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+class Instrumentation():
+    # counters and accumulated wall time per phase; every event is also
+    # forwarded to the callbacks as callback(kind, name, value) with kind
+    # "count" or "time". Attached to LayerMapEditor/UnitManager through their
+    # instrument attribute, which is None (no bookkeeping at all) by default
+    def __init__(self, callbacks=None):
+        self.counters = {}
+        self.timers = {}
+        self.callbacks = list(callbacks) if callbacks else []
+
+    def addCallback(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0)+n
+        for callback in self.callbacks:
+            callback("count", name, n)
+
+    def addTime(self, name, sec):
+        self.timers[name] = self.timers.get(name, 0.0)+sec
+        for callback in self.callbacks:
+            callback("time", name, sec)
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.addTime(name, time.perf_counter()-t0)
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+
+    def snapshot(self):
+        return {"counters":dict(self.counters), "timers":dict(self.timers)}
+
+    def __repr__(self):
+        counters = ', '.join(f'{k}={v}' for k,v in self.counters.items())
+        timers = ', '.join(f'{k}={v*1e3:.3f}ms' for k,v in self.timers.items())
+        return f"Instrumentation({counters}; {timers})"
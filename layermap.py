@@ -1,26 +1,147 @@
 import os
+import re
+import zlib
+import struct
+import warnings
+import time
+from contextlib import contextmanager
+from collections import OrderedDict, namedtuple
 from . import units
+from . import layerstack
+from . import instrument
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import copy
+
+# bump whenever parsing results change, it is part of the cache key
+parser_version = 4
+
+# num counter of each entry type
+num_keys = {"dielectric":"layer", "conductor":"conductor", "via":"via"}
+
+# commands that define a stack entry, and the ones that pull rows from or
+# edit entries of another place, which make a line table position dependent
+entry_cmds = ["layer", "conductor", "via"]
+fragment_cmds = ["include", "inherit", "override"]
+fragment_re = re.compile(r'^\s*(?:include|inherit)\s', re.MULTILINE)
+
+# parsed include/inherit fragments shared by every LayerMapEditor, keyed by
+# file identity and the parse context they start from
+fragment_cache = OrderedDict()
+max_fragments = 64
+
+def clearFragmentCache():
+    fragment_cache.clear()
+
+# glyph outlines at 1pt (vertices, codes, advance) shared by every render,
+# so labels are assembled into one path instead of laid out one by one, and
+# the laid out label strings of the last max_texts labels
+glyph_cache = {}
+text_cache = OrderedDict()
+max_texts = 8192
+
+def getGlyph(char):
+    glyph = glyph_cache.get(char)
+    if glyph is None:
+        from matplotlib.path import Path
+        from matplotlib.textpath import TextPath, text_to_path
+        from matplotlib.font_manager import FontProperties
+        prop = FontProperties(size=100)
+        path = TextPath((0,0), char, size=100, prop=prop)
+        codes = path.codes if path.codes is not None else np.full(len(path.vertices), Path.LINETO, dtype=Path.code_type)
+        width = text_to_path.get_text_width_height_descent(char, prop, ismath=False)[0]
+        glyph = (path.vertices/100, codes, width/100)
+        glyph_cache[char] = glyph
+    return glyph
+
+def getTextRun(text):
+    # glyphs of a whole string laid out by advance width (no kerning) at 1pt,
+    # as (vertices, codes, width); repeated renders reuse every label's run
+    run = text_cache.get(text)
+    if run is None:
+        glyphs = [getGlyph(char) for char in text]
+        if glyphs:
+            advs = np.cumsum([0.0]+[glyph[2] for glyph in glyphs])
+            verts = np.concatenate([glyph[0]+(adv,0.0) for glyph,adv in zip(glyphs, advs)])
+            run = (verts, np.concatenate([glyph[1] for glyph in glyphs]), advs[-1])
+        else:
+            run = (np.empty((0,2)), np.empty(0, dtype=np.uint8), 0.0)
+        text_cache[text] = run
+        if len(text_cache)>max_texts:
+            text_cache.popitem(last=False)
+    return run
+
+def labelPath(labels, xPts, yPts):
+    # one compound path of all labels, each (text, x, y, fontSize, ha, va)
+    # with ha "center"/"left" and va "center"/"top"; xPts/yPts are points per
+    # data unit
+    from matplotlib.path import Path
+    capHeight = getGlyph("X")[0][:,1].max()
+    runs = [getTextRun(label[0]) for label in labels]
+    counts = np.array([len(run[0]) for run in runs], dtype=int)
+    if not counts.sum():
+        return Path(np.empty((0,2)))
+    textWidth = np.array([run[2] for run in runs])
+    x, y, fontSize = (np.array([label[k] for label in labels], dtype=float) for k in (1,2,3))
+    left = np.where([label[4]=="center" for label in labels], x-textWidth*fontSize/(2*xPts), x)
+    base = np.where([label[5]=="center" for label in labels], y-capHeight*fontSize/(2*yPts), y-capHeight*fontSize/yPts)
+    verts = np.concatenate([run[0] for run in runs])
+    scale = np.repeat(fontSize, counts)
+    verts[:,0] = verts[:,0]*scale/xPts+np.repeat(left, counts)
+    verts[:,1] = verts[:,1]*scale/yPts+np.repeat(base, counts)
+    return Path(verts, np.concatenate([run[1] for run in runs]))
+
+def writePNG(fname, rgba, dpi=72, level=1):
+    # rgb rows unfiltered at a low zlib level: on a tall, mostly flat stack
+    # image Pillow's adaptive row filter costs more than the size it saves
+    h, w = rgba.shape[:2]
+    raw = np.empty((h, w*3+1), dtype=np.uint8)
+    raw[:,0] = 0
+    raw[:,1:].reshape(h, w, 3)[...] = rgba[:,:,:3]
+    def chunk(tag, data):
+        return struct.pack(">I", len(data))+tag+data+struct.pack(">I", zlib.crc32(tag+data))
+    ppm = round(dpi/0.0254)
+    data = b"".join([b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)),
+        chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1)),
+        chunk(b"IDAT", zlib.compress(raw, level)),
+        chunk(b"IEND", b"")])
+    if hasattr(fname, "write"):
+        fname.write(data)
+    else:
+        with open(fname, mode='wb') as f:
+            f.write(data)
+
+# only tokens starting like a float literal are handed to float()
+num_re = re.compile(r'[-+]?(?:[0-9.]|inf|nan)', re.IGNORECASE)
 
 class LayerMapEditor():
-    def __init__(self, layermap_file, defLen="m", defCond="S/m"):
+    def __init__(self, layermap_file, defLen="m", defCond="S/m", maxConvPlans=128, cache=None, instrument=None, validate=True):
         self.um = units.UnitManager()
+        self.setInstrument(instrument)
+        self.convPlans = OrderedDict()
+        self.maxConvPlans = maxConvPlans
+        self.cache = cache
         self.cmds = {
             "assume":{
                 "opts":["phyName","unitName"],
                 "minOpts":2},
             "layer":{
-                "opts":["layerName","height","dielectric","conductivity","tandel"],
+                "opts":["layerName","height","dielectric","conductivity","tandel","tcr","tcr2","tempRef","freqRef"],
                 "minOpts":3},
             "conductor":{
-                "opts":["condName","height","conductivity","offset","bias"],
+                "opts":["condName","height","conductivity","offset","bias","tcr","tcr2","tempRef"],
                 "minOpts":3},
             "via":{
-                "opts":["viaName","bottomCondName","topCondName","conductivity"],
-                "minOpts":4}
+                "opts":["viaName","bottomCondName","topCondName","conductivity","tcr","tcr2","tempRef"],
+                "minOpts":4},
+            "include":{
+                "opts":["fileName"],
+                "minOpts":1},
+            "inherit":{
+                "opts":["fileName","untilName"],
+                "minOpts":1},
+            "override":{
+                "opts":["entryName","dielectric","conductivity","tandel"],
+                "minOpts":1}
         }
         self.opts = {
             "phyName":{"key":"-pn","dim":"string"},
@@ -36,6 +157,13 @@ class LayerMapEditor():
             "viaName":{"key":"-vn","dim":"string"},
             "bottomCondName":{"key":"-bcn","dim":"string"},
             "topCondName":{"key":"-tcn","dim":"string"},
+            "fileName":{"key":"-f","dim":"string"},
+            "untilName":{"key":"-u","dim":"string"},
+            "entryName":{"key":"-n","dim":"string"},
+            "tcr":{"key":"-tc","dim":"dimless"},
+            "tcr2":{"key":"-tc2","dim":"dimless"},
+            "tempRef":{"key":"-tr","dim":"temperature"},
+            "freqRef":{"key":"-fr","dim":"frequency"},
         }
         self.dims = {
             "string":{
@@ -49,13 +177,68 @@ class LayerMapEditor():
                 "dtype":float},
             "conductivity":{
                 "defUnit":defCond,
+                "dtype":float},
+            "temperature":{
+                "defUnit":"K",
+                "dtype":float},
+            "frequency":{
+                "defUnit":"Hz",
                 "dtype":float}
         }
+        self.genCmdTables()
+        self.cmdFuncs = {
+            "assume":self.addAssume,
+            "layer":self.addLayer,
+            "conductor":self.addConductor,
+            "via":self.addVia,
+            "include":self.addInclude,
+            "inherit":self.addInherit,
+            "override":self.addOverride}
         self.initlayerData()
-        self.importFile(layermap_file)
+        self.crHg = [0,0]
+        self.diagnostics = []
+        self.fileName = None
+        # files being parsed, innermost last; relative includes resolve
+        # against the last one
+        self.includeStack = []
+        self.lineTable = None
+        self.lineState = None
+        # with validate, findings holds validateStack() of the current stack
+        # after every import, reload and overwriting merge
+        self.validate = validate
+        self.findings = []
+        self.history = None
+        if layermap_file is not None:
+            self.importFile(layermap_file)
+
+    def setInstrument(self, inst):
+        # inst is an instrument.Instrumentation shared with self.um, or None
+        self.instrument = inst
+        self.um.instrument = inst
+
+    @contextmanager
+    def instrumented(self, inst=None, callback=None):
+        # counters/timers for everything done inside the block
+        inst = inst if inst is not None else instrument.Instrumentation()
+        if callback is not None:
+            inst.addCallback(callback)
+        orgInst = self.instrument
+        self.setInstrument(inst)
+        try:
+            yield inst
+        finally:
+            self.setInstrument(orgInst)
+
+    def countCopy(self, layerData):
+        # LayerStack.copy() re-creates the containers, the records are shared
+        self.instrument.count("copies")
+        self.instrument.count("copiedEntries", len(layerData.stack)+len(layerData.materials))
 
     def initlayerData(self):
-        self.layerData = {"stack":{}, "materials":{}, "num":{"layer":0, "conductor":0, "via":0}, "unit":{"length":None, "conductivity":None}}
+        self.layerData = layerstack.LayerStack()
+
+    def getLayerStack(self, layerData=None):
+        return self.layerData if layerData is None else layerstack.LayerStack.fromDict(layerData)
 
     def isNum(self, str):
         try:
@@ -66,80 +249,100 @@ class LayerMapEditor():
             return True
 
     def strToFloat(self, val):
-        if self.isNum(val):
-            return float(val)
-        elif val in ["nan","inf","-inf"]:
-            return float(val)
-        else:
+        if num_re.match(val) is None:
+            return val
+        try:
+            return float(val.replace(',',''))
+        except ValueError:
             return val
 
+    def genCmdTables(self):
+        # per-command option tables, built once so parsing a line is dict probes only
+        self.cmdTables = {}
+        for cmd,cData in self.cmds.items():
+            opts = cData["opts"]
+            self.cmdTables[cmd] = {
+                "opts":opts,
+                "keys":{self.opts[opt]["key"]:idx for idx,opt in enumerate(opts)},
+                "dims":[self.opts[opt]["dim"] for opt in opts],
+                "minOpts":cData["minOpts"]}
+
     def transArgs(self, cmd, args):
-        try:
-            allOpts = self.cmds[cmd]["opts"]
-            allKeys = [self.opts[opt]["key"] for opt in allOpts]
-            allDefUnits = [self.dims[self.opts[opt]["dim"]]["defUnit"] for opt in allOpts]
-            sprArgs = []
-            retArgs = {opt:{"val":None,"unit":None} for opt in allOpts}
-
-            args = list(map(self.strToFloat, args))
-            args.append("EOA")
-            crIdx, tmpArg = (0,None)
-            for i,arg in enumerate(args):
-                if tmpArg in allKeys:
-                    pass
-                elif type(tmpArg) is float and self.um.isValid(arg):
-                    pass
-                else:
-                    if crIdx<i:
-                        sprArgs.append(args[crIdx:i])
-                        crIdx = i
-                tmpArg = arg
-
-            for i,args in enumerate(sprArgs):
-                opt,unit,val = (None,None,None)
-                for j,arg in enumerate(args):
-                    if arg in allKeys:
-                        opt = allOpts[allKeys.index(arg)]
-                    elif self.um.isValid(arg):
-                        if val is None:
-                            val = arg
-                        elif type(val) is float:
-                            unit = arg
-                        else:
-                            raise optError("inValidUnit", i, arg)
-                    else:
-                        val = arg
-
-                idx = None
-                if opt is None:
-                    retVal = [v["val"] for v in retArgs.values()]
-                    if None not in retVal:
-                        raise optError("overArgs", len(self.cmds[cmd]["opts"]))
-                    idx = retVal.index(None)
-                    opt = allOpts[idx]
+        table = self.cmdTables[cmd]
+        keys = table["keys"]
+        unitIndex = self.um.unitIndex
+        vals = [None]*len(table["opts"])
+        units = [None]*len(table["opts"])
+
+        # an argument group is "[key] val [unit]"; a new group starts unless the
+        # previous token was a key or this token is the unit of a preceding number.
+        # raw keeps the token of a number, for options that take a name
+        grpIdx, opt, unit, val, raw = (-1,None,None,None,None)
+        tmpArg = None
+        for tok in args:
+            arg = self.strToFloat(tok)
+            if grpIdx<0 or not (tmpArg in keys or (type(tmpArg) is float and arg in unitIndex)):
+                if grpIdx>=0:
+                    self.setOptArg(table, vals, units, opt, val, unit, raw)
+                grpIdx, opt, unit, val, raw = (grpIdx+1,None,None,None,None)
+
+            if arg in keys:
+                opt = keys[arg]
+            elif arg in unitIndex:
+                if val is None:
+                    val = arg
+                elif type(val) is float:
+                    unit = arg
                 else:
-                    idx = allOpts.index(opt)
-                unit = unit if unit else allDefUnits[idx]
-                retArgs[opt]["val"] = val
-                retArgs[opt]["unit"] = unit
+                    raise optError("inValidUnit", grpIdx, arg)
+            else:
+                val, raw = (arg, tok)
+            tmpArg = arg
+        if grpIdx>=0:
+            self.setOptArg(table, vals, units, opt, val, unit, raw)
 
-            if None in list(retArgs.values())[0:self.cmds[cmd]["minOpts"]]:
-                raise optError("lessArgs", self.cmds[cmd]["minOpts"])
-            return copy.deepcopy(retArgs)
+        if self.instrument is not None:
+            # one unitIndex probe per token
+            self.instrument.count("unitLookups", len(args))
+        if None in vals[0:table["minOpts"]]:
+            raise optError("lessArgs", table["minOpts"])
+        return {opt:{"val":vals[idx],"unit":units[idx]} for idx,opt in enumerate(table["opts"])}
 
-        except optError as e:
-            raise optError(*e.args)
+    def setOptArg(self, table, vals, units, idx, val, unit, raw=None):
+        if idx is None:
+            if None not in vals:
+                raise optError("overArgs", len(table["opts"]))
+            idx = vals.index(None)
+        dtype = self.dims[table["dims"][idx]]["dtype"]
+        if val is not None and type(val) is not float and dtype is float:
+            # a name or unit where a number belongs
+            raise optError("inValidValue", val, table["opts"][idx])
+        if type(val) is float and dtype is str:
+            # a number given as a name ("layer 1 ..."), kept as written
+            if unit:
+                raise optError("inValidValue", raw, table["opts"][idx])
+            val = raw
+        vals[idx] = val
+        units[idx] = unit if unit else self.dims[table["dims"][idx]]["defUnit"]
+
+    def getConvPlan(self, unit1, unit2):
+        key = (unit1, unit2, self.dims["length"]["defUnit"])
+        plan = self.convPlans.get(key)
+        if plan is None:
+            plan = self.um.genResistivityPlan(unit1, unit2, key[2])
+            self.convPlans[key] = plan
+            if len(self.convPlans)>self.maxConvPlans:
+                self.convPlans.popitem(last=False)
+        else:
+            self.convPlans.move_to_end(key)
+        return plan
 
     def convResistivity(self, t, val, unit1=None, unit2=None):
-        t = self.um.convUnit(val=t,unit1=self.dims["length"]["defUnit"])
         unit1 = unit1 if unit1 else self.dims["conductivity"]["defUnit"]
         unit2 = unit2 if unit2 else self.dims["conductivity"]["defUnit"]
-        dimC1 = self.um.getDimName(unit1)
-        dimC2 = self.um.getDimName(unit2)
-        val = self.um.convUnit(val=val,unit1=unit1)
-        val = self.um.transResistivity(t, val, dimC1, dimC2)
-        val = self.um.convUnit(val=val,unit2=unit2)
-        return val
+        if self.instrument is not None:
+            self.instrument.count("conversions", np.size(val))
+        return self.getConvPlan(unit1, unit2)(t, val)
 
     def convDefUnit(self, opt, val, unit):
         unit2 = self.dims[self.opts[opt]["dim"]]["defUnit"]
@@ -148,280 +351,830 @@ class LayerMapEditor():
         else:
             return val
 
+    def getMatModel(self, dictArgs):
+        # optional temperature/dispersion options as Material keywords; tcr is
+        # per K and the references are stored in K and Hz
+        vals = {}
+        for opt in ["tcr","tcr2"]:
+            if dictArgs[opt]["val"] is not None:
+                vals[opt] = self.convDefUnit(opt, dictArgs[opt]["val"], dictArgs[opt]["unit"])
+        if dictArgs["tempRef"]["val"] is not None:
+            vals["tempRef"] = self.um.convUnit(val=dictArgs["tempRef"]["val"], unit1=dictArgs["tempRef"]["unit"], unit2="K")
+        elif vals:
+            from . import matmodel
+            vals["tempRef"] = matmodel.def_temp_ref
+        if "freqRef" in dictArgs and dictArgs["freqRef"]["val"] is not None:
+            vals["freqRef"] = self.um.convUnit(val=dictArgs["freqRef"]["val"], unit1=dictArgs["freqRef"]["unit"], unit2="Hz")
+        return vals
+
     def updateUnit(self, dim, unit):
         try:
             if dim not in self.dims.keys():
                 raise optError("unDefDimName", dim)
             elif not self.um.isValid(unit):
                 raise optError("inValidUnitName", unit)
+            if self.dims[dim]["defUnit"]!=unit:
+                self.convPlans.clear()
             self.dims[dim]["defUnit"] = unit
 
         except optError as e:
             raise optError(*e.args)
 
-    def importFile(self, fileName, matPrefix='T65_'):
+    def importFile(self, fileName, matPrefix='T65_', verbose=True):
+        if self.instrument is not None:
+            with self.instrument.phase("import"):
+                return self.importFileImpl(fileName, matPrefix, verbose)
+        return self.importFileImpl(fileName, matPrefix, verbose)
+
+    def importFileImpl(self, fileName, matPrefix, verbose):
         self.initlayerData()
+        self.fileName = fileName
+        self.includeStack = [os.path.realpath(fileName)]
+        self.lineTable = None
+        if self.cache is None:
+            with open(fileName, mode='r') as f:
+                diagnostics = self.importLines(f, matPrefix)
+        else:
+            diagnostics = self.importCached(fileName, matPrefix)
+        self.autoValidate()
+        self.commitHistory("import")
+        if verbose:
+            for diag in diagnostics:
+                print(diag)
+        return diagnostics
 
-        crHg = [0,0]
-        cmds = list(self.cmds.keys())
+    def importCached(self, fileName, matPrefix='T65_'):
         with open(fileName, mode='r') as f:
-            try:
-                for i,row in enumerate(f):
-                    str_arr = row.split()
-                    if str_arr==[]:
-                        continue
-
-                    cmd = str_arr[0]
-                    args = str_arr[1:]
-                    if cmd=="#":
-                        continue
-                    elif cmd not in cmds:
-                        raise cmdError("unDefCmd",i,cmd)
-
-                    try:
-                        dictArgs = self.transArgs(cmd, args)
-                    except optError as e:
-                        args = list(e.args)
-                        args.insert(1, i)
-                        raise optError(*args)
-
-                    if cmd==cmds[0]:
-                        try:
-                            self.updateUnit(dictArgs["phyName"]["val"], dictArgs["unitName"]["val"])
-                        except optError as e:
-                            args = list(e.args)
-                            args.insert(1, i)
-                            raise optError(*args)
-
-                    elif cmd==cmds[1]:
-                        layerName = dictArgs["layerName"]["val"]
-                        h = self.convDefUnit("height",dictArgs["height"]["val"],dictArgs["height"]["unit"])
-                        dc = self.convDefUnit("dielectric",dictArgs["dielectric"]["val"],dictArgs["dielectric"]["unit"])
-                        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"]) if dictArgs["conductivity"]["val"] else np.nan
-                        tandel = self.convDefUnit("tandel",dictArgs["tandel"]["val"],dictArgs["tandel"]["unit"]) if dictArgs["tandel"]["val"] else np.nan
-
-                        matName = matPrefix+layerName
-                        range = [crHg[1], crHg[1]+h]
-
-                        self.layerData["stack"][layerName] = {
-                            "type":"dielectric",
-                            "material":matName,
-                            "height":h,
-                            "range":range}
-                        self.layerData["materials"][matName] = {
-                            "type":"dielectric",
-                            "constant":dc,
-                            "conductivity":cond,
-                            "height":h,
-                            "tandel":tandel}
-                        self.layerData["num"]["layer"] += 1
-                        crHg = range.copy()
-
-                    elif cmd==cmds[2]:
-                        condName = dictArgs["condName"]["val"]
-                        h = self.convDefUnit("height",dictArgs["height"]["val"],dictArgs["height"]["unit"])
-                        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"])
-                        offset = self.convDefUnit("offset",dictArgs["offset"]["val"],dictArgs["offset"]["unit"]) if dictArgs["offset"]["val"] else 0.0
-                        bias = self.convDefUnit("bias",dictArgs["bias"]["val"],dictArgs["bias"]["unit"]) if dictArgs["bias"]["val"] else 0.0
-
-                        matName = matPrefix+condName
-                        range = [crHg[0]+offset-bias/2, crHg[0]+offset+h+bias/2]
-
-                        self.layerData["stack"][condName] = {
-                            "type":"conductor",
-                            "material":matName,
-                            "height":h+bias,
-                            "range":range,
-                            "offset":offset-bias/2,
-                            "origin":crHg[0]}
-                        self.layerData["materials"][matName] = {
-                            "type":"conductor",
-                            "conductivity":cond,
-                            "height":h}
-                        self.layerData["num"]["conductor"] += 1
-
-                    elif cmd==cmds[3]:
-                        viaName = dictArgs["viaName"]["val"]
-                        btmCondName = dictArgs["bottomCondName"]["val"]
-                        topCondName = dictArgs["topCondName"]["val"]
-
-                        if btmCondName not in self.layerData["stack"].keys():
-                            raise optError("unDefCondName",i,btmCondName)
-                        if topCondName not in self.layerData["stack"].keys():
-                            raise optError("unDefCondName",i,topCondName)
-                        range1 = self.layerData["stack"][btmCondName]["range"]
-                        range2 = self.layerData["stack"][topCondName]["range"]
-                        if range1[1]<=range2[0]:
-                            range = [range1[1], range2[0]]
-                            offset = self.layerData["stack"][btmCondName]["offset"]
-                            origin = self.layerData["stack"][btmCondName]["origin"]
-                        else:
-                            range = [range2[1], range1[0]]
-                            offset = self.layerData["stack"][topCondName]["offset"]
-                            origin = self.layerData["stack"][topCondName]["origin"]
-
-                        matName = matPrefix+viaName
-                        h = range[1]-range[0]
-                        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"])
-
-                        self.layerData["stack"][viaName] = {
-                            "type":"via",
-                            "material":matName,
-                            "height":h,
-                            "range":range,
-                            "offset":offset,
-                            "origin":origin}
-                        self.layerData["materials"][matName] = {
-                            "type":"conductor",
-                            "conductivity":cond,
-                            "height":h}
-                        self.layerData["num"]["via"] += 1
-
-            except cmdError as e:
-                if e.args[0]=="unDefCmd":
-                    msg = f"Undefined command \"{e.args[2]}\" at {e.args[1]} line."
-                print("Command Error: "+msg)
-
-            except optError as e:
-                if e.args[0]=="lessArgs":
-                    msg = f"At least {e.args[2]} arguments are required at {e.args[1]} line."
-                elif e.args[0]=="overArgs":
-                    msg = f"Too many arguments at {e.args[1]} line, maximum is {e.args[2]}."
-                elif e.args[0]=="inValidUnit":
-                    msg = f"Invalid unit \"{e.args[3]}\" at {e.args[1]} line, {e.args[2]} argument."
-                elif e.args[0]=="unDefCondName":
-                    msg = f"Undefined conductor name \"{e.args[2]}\" at {e.args[1]} line."
-                elif e.args[0]=="unDefDimName":
-                    msg = f"Undefined dimension name \"{e.args[2]}\" at {e.args[1]} line."
-                elif e.args[0]=="inValidUnitName":
-                    msg = f"Invalid unit name \"{e.args[2]}\" at {e.args[1]} line."
-                print("Option Error: "+msg)
+            text = f.read()
+        if fragment_re.search(text):
+            # the key cannot see changes to included files
+            return self.importLines(text.splitlines(), matPrefix)
+        # registered units/prefixes change how tokens parse, so their digest is keyed too
+        key = self.cache.genKey(text.encode(), parser_version, matPrefix, sorted(self.getDefUnits().items()), self.um.getUnitDigest())
+        entry = self.cache.load(key)
+        if entry is not None:
+            meta, stackArr, matArr = entry
+            return self.loadState(meta, stackArr, matArr)
+
+        diagnostics = self.importLines(text.splitlines(), matPrefix)
+        try:
+            meta, stackArr, matArr = self.dumpState()
+        except (ValueError, TypeError):
+            # values the columns cannot hold (e.g. a unit name given as a value) are not cached
+            return diagnostics
+        self.cache.store(key, meta, stackArr, matArr)
+        return diagnostics
+
+    def dumpState(self):
+        # parsed state as plain (json/pickle friendly) meta plus the two column tables
+        layerNames, stackArr, matNames, matArr = self.layerData.toArrays()
+        meta = {
+            "layerNames":layerNames,
+            "matNames":matNames,
+            "num":dict(self.layerData.num),
+            "unit":dict(self.layerData.unit),
+            "defUnits":{dim:dData["defUnit"] for dim,dData in self.dims.items()},
+            "crHg":list(self.crHg),
+            "diagnostics":[list(diag) for diag in self.diagnostics]}
+        return meta, stackArr, matArr
+
+    def loadState(self, meta, stackArr, matArr):
+        self.layerData = layerstack.LayerStack.fromArrays(meta["layerNames"], stackArr, meta["matNames"], matArr, dict(meta["num"]), dict(meta["unit"]))
+        for dim,unit in meta["defUnits"].items():
+            self.updateUnit(dim, unit)
+        self.crHg = list(meta["crHg"])
+        self.diagnostics = [Diagnostic(line, column, code, kind, tuple(args)) for line,column,code,kind,args in meta["diagnostics"]]
+        return self.diagnostics
+
+    def importLines(self, lines, matPrefix='T65_'):
+        initUnits = {dim:dData["defUnit"] for dim,dData in self.dims.items()}
+        self.crHg = [0,0]
+        self.diagnostics = []
+        self.lineTable = [self.importLine(i, row, matPrefix) for i,row in enumerate(lines)]
+        self.saveLineState(matPrefix, initUnits)
+        return self.diagnostics
+
+    def importLine(self, i, row, matPrefix):
+        # parse one row into layerData; returns its line table entry
+        # (row, cmd, defined name, crHg before the row)
+        crHg = self.crHg
+        row = row.rstrip("\n")
+        str_arr = row.split()
+        if str_arr==[] or str_arr[0][0]=="#":
+            return (row, None, None, crHg)
+
+        cmd = str_arr[0]
+        name = None
+        inst = self.instrument
+        try:
+            if cmd not in self.cmdFuncs:
+                raise cmdError("unDefCmd", cmd)
+            if inst is None:
+                dictArgs = self.transArgs(cmd, str_arr[1:])
+                self.cmdFuncs[cmd](dictArgs, matPrefix)
+            else:
+                # tokenize: option/unit resolution, build: conversions and
+                # range bookkeeping
+                inst.count("linesParsed")
+                t0 = time.perf_counter()
+                dictArgs = self.transArgs(cmd, str_arr[1:])
+                t1 = time.perf_counter()
+                self.cmdFuncs[cmd](dictArgs, matPrefix)
+                inst.addTime("tokenize", t1-t0)
+                inst.addTime("build", time.perf_counter()-t1)
+            if cmd in entry_cmds:
+                name = dictArgs[self.cmds[cmd]["opts"][0]]["val"]
+        except (cmdError, optError) as e:
+            self.diagnostics.append(Diagnostic.fromError(e, i, row))
+        return (row, cmd, name, crHg)
+
+    def saveLineState(self, matPrefix, initUnits):
+        # what the line table was parsed against; reload() re-parses
+        # everything when any of it no longer holds
+        self.lineState = {
+            "matPrefix":matPrefix,
+            "initUnits":initUnits,
+            "defUnits":{dim:dData["defUnit"] for dim,dData in self.dims.items()},
+            "layerData":self.layerData}
+
+    def reload(self, fileName=None, matPrefix=None, verbose=True):
+        # re-import an edited layermap, re-parsing only the rows that differ
+        # from the last import and shifting everything parsed after them
+        fileName = fileName if fileName is not None else self.fileName
+        state = self.lineState
+        matPrefix = matPrefix if matPrefix is not None else (state["matPrefix"] if state else 'T65_')
+        with open(fileName, mode='r') as f:
+            rows = [row.rstrip("\n") for row in f]
+        self.includeStack = [os.path.realpath(fileName)]
+        report = None
+        if self.lineTable is not None and state["matPrefix"]==matPrefix and state["layerData"] is self.layerData \
+                and state["defUnits"]=={dim:dData["defUnit"] for dim,dData in self.dims.items()}:
+            report = self.reloadLines(rows, matPrefix)
+        if report is None:
+            report = self.reloadFull(rows, matPrefix)
+        if self.instrument is not None:
+            self.instrument.count("linesReparsed", report.reparsed)
+        self.autoValidate()
+        self.commitHistory("reload")
+        self.fileName = fileName
+        if verbose:
+            for diag in report.diagnostics:
+                print(diag)
+        return report
+
+    def reloadFull(self, rows, matPrefix):
+        orgLayerData = self.layerData
+        if self.lineState is not None:
+            for dim,unit in self.lineState["initUnits"].items():
+                self.updateUnit(dim, unit)
+        self.initlayerData()
+        diagnostics = self.importLines(rows, matPrefix)
+        orgStack, orgMaterials = orgLayerData.stack, orgLayerData.materials
+        stack, materials = self.layerData.stack, self.layerData.materials
+        modified = [lName for lName,lData in stack.items() if lName in orgStack and not (lData.isSame(orgStack[lName])
+            and orgStack[lName].material in orgMaterials and materials[lData.material].isSame(orgMaterials[orgStack[lName].material]))]
+        return ReloadReport(True,
+            [lName for lName in stack if lName not in orgStack],
+            [lName for lName in orgStack if lName not in stack],
+            modified, [], len(rows), diagnostics)
+
+    def reloadLines(self, rows, matPrefix):
+        lineTable = self.lineTable
+        nOld, nNew = len(lineTable), len(rows)
+        p = 0
+        while p<min(nOld,nNew) and lineTable[p][0]==rows[p]:
+            p += 1
+        s = 0
+        while s<min(nOld,nNew)-p and lineTable[nOld-1-s][0]==rows[nNew-1-s]:
+            s += 1
+        oEnd, nEnd = nOld-s, nNew-s
+
+        # unit context and unique names are what make rows independent of
+        # the ones around them; otherwise fall back to a full re-parse
+        if any(entry[1]=="assume" for entry in lineTable[p:]) or any(row.split()[:1]==["assume"] for row in rows[p:nEnd]) \
+                or any(entry[1] in fragment_cmds for entry in lineTable):
+            return None
+        stack = self.layerData.stack
+        materials = self.layerData.materials
+        if sum(entry[2] is not None for entry in lineTable)!=len(stack):
+            return None
+        prefixNames = [entry[2] for entry in lineTable[:p] if entry[2] is not None]
+        oldNames = [entry[2] for entry in lineTable[p:oEnd] if entry[2] is not None]
+        suffixNames = {entry[2] for entry in lineTable[oEnd:] if entry[2] is not None}
+
+        orgLayerData, orgDiags, orgCrHg = (self.layerData, self.diagnostics, self.crHg)
+        num = {"layer":0, "conductor":0, "via":0}
+        for lName in prefixNames:
+            num[num_keys[stack[lName].type]] += 1
+        self.layerData = layerstack.LayerStack(
+            {lName:stack[lName] for lName in prefixNames},
+            {stack[lName].material:materials[stack[lName].material] for lName in prefixNames},
+            num, dict(orgLayerData.unit))
+        self.diagnostics = [diag for diag in orgDiags if diag.line<p]
+        self.crHg = lineTable[p][3] if p<nOld else orgCrHg
+        newEntries = [self.importLine(p+j, row, matPrefix) for j,row in enumerate(rows[p:nEnd])]
+        newNames = [entry[2] for entry in newEntries if entry[2] is not None]
+        if len(set(newNames))!=len(newNames) or len(self.layerData.stack)!=len(prefixNames)+len(newNames) or not suffixNames.isdisjoint(newNames):
+            self.layerData, self.diagnostics, self.crHg = (orgLayerData, orgDiags, orgCrHg)
+            return None
+
+        # rows below the edit keep their parse and move by the height delta:
+        # conductors up to the next dielectric follow crHg[0], the rest crHg[1]
+        oldAfter = lineTable[oEnd][3] if oEnd<nOld else orgCrHg
+        newAfter = self.crHg
+        d0, d1 = (newAfter[0]-oldAfter[0], newAfter[1]-oldAfter[1])
+        shifts = dict.fromkeys(prefixNames, 0.0)
+        oldDiags = {}
+        for diag in orgDiags:
+            if diag.line>=oEnd:
+                oldDiags.setdefault(diag.line, []).append(diag)
+        newStack = self.layerData.stack
+        newMaterials = self.layerData.materials
+        shifted, reparsed = ([], [])
+        afterLayer = False
+        for k,(row,cmd,name,crHg) in enumerate(lineTable[oEnd:]):
+            line = nEnd+k
+            crHg = [crHg[0]+d1, crHg[1]+d1] if afterLayer else newAfter
+            self.crHg = crHg
+            lData = stack[name] if name is not None else None
+            if cmd=="via":
+                ends = lData.connects if lData is not None else (None, None)
+                dz = shifts.get(ends[0]) if ends[0] in shifts and shifts.get(ends[0])==shifts.get(ends[1]) else None
+                if lData is None or dz is None:
+                    entry = self.importLine(line, row, matPrefix)
+                    reparsed.append(line)
+                    if entry[2] is not None:
+                        shifts[entry[2]] = None
+                        shifted.append(entry[2])
+                    lineTable[oEnd+k] = entry
+                    continue
+            elif lData is None:
+                self.diagnostics += [diag._replace(line=line) for diag in oldDiags.get(oEnd+k, [])]
+                lineTable[oEnd+k] = (row, cmd, name, crHg)
+                continue
+            elif lData.type=="dielectric":
+                dz = d1
+                afterLayer = True
+            else:
+                dz = d1 if afterLayer else d0
+            if dz!=0:
+                lData = lData.replace(z0=lData.z0+dz, z1=lData.z1+dz, origin=None if lData.origin is None else lData.origin+dz)
+                shifted.append(name)
+            shifts[name] = dz
+            newStack[name] = lData
+            newMaterials[lData.material] = materials[lData.material]
+            self.layerData.num[num_keys[lData.type]] += 1
+            self.diagnostics += [diag._replace(line=line) for diag in oldDiags.get(oEnd+k, [])]
+            lineTable[oEnd+k] = (row, cmd, name, crHg)
+        if not afterLayer:
+            self.crHg = newAfter
+        else:
+            self.crHg = [orgCrHg[0]+d1, orgCrHg[1]+d1]
+        self.diagnostics.sort(key=lambda diag: diag.line)
+        self.lineTable = lineTable[:p]+newEntries+lineTable[oEnd:]
+
+        modified = [lName for lName in newNames if lName in oldNames and not (newStack[lName].isSame(stack[lName])
+            and newMaterials[newStack[lName].material].isSame(materials[stack[lName].material]))]
+        self.saveLineState(matPrefix, self.lineState["initUnits"])
+        return ReloadReport(False,
+            [lName for lName in newNames if lName not in oldNames],
+            [lName for lName in oldNames if lName not in newNames],
+            modified, shifted, (nEnd-p)+len(reparsed), self.diagnostics)
+
+    def addAssume(self, dictArgs, matPrefix):
+        self.updateUnit(dictArgs["phyName"]["val"], dictArgs["unitName"]["val"])
+
+    def addLayer(self, dictArgs, matPrefix):
+        crHg = self.crHg
+        layerName = dictArgs["layerName"]["val"]
+        h = self.convDefUnit("height",dictArgs["height"]["val"],dictArgs["height"]["unit"])
+        dc = self.convDefUnit("dielectric",dictArgs["dielectric"]["val"],dictArgs["dielectric"]["unit"])
+        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"]) if dictArgs["conductivity"]["val"] else np.nan
+        tandel = self.convDefUnit("tandel",dictArgs["tandel"]["val"],dictArgs["tandel"]["unit"]) if dictArgs["tandel"]["val"] else np.nan
+
+        matName = matPrefix+layerName
+        range = [crHg[1], crHg[1]+h]
+
+        self.layerData.stack[layerName] = layerstack.StackLayer("dielectric", matName, h, range[0], range[1])
+        self.layerData.materials[matName] = layerstack.Material("dielectric", constant=dc, conductivity=cond, height=h, tandel=tandel, **self.getMatModel(dictArgs))
+        self.layerData.num["layer"] += 1
+        self.crHg = range
+
+    def addConductor(self, dictArgs, matPrefix):
+        crHg = self.crHg
+        condName = dictArgs["condName"]["val"]
+        h = self.convDefUnit("height",dictArgs["height"]["val"],dictArgs["height"]["unit"])
+        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"])
+        offset = self.convDefUnit("offset",dictArgs["offset"]["val"],dictArgs["offset"]["unit"]) if dictArgs["offset"]["val"] else 0.0
+        bias = self.convDefUnit("bias",dictArgs["bias"]["val"],dictArgs["bias"]["unit"]) if dictArgs["bias"]["val"] else 0.0
+
+        matName = matPrefix+condName
+        range = [crHg[0]+offset-bias/2, crHg[0]+offset+h+bias/2]
+
+        self.layerData.stack[condName] = layerstack.StackLayer("conductor", matName, h+bias, range[0], range[1], offset-bias/2, crHg[0])
+        self.layerData.materials[matName] = layerstack.Material("conductor", conductivity=cond, height=h, **self.getMatModel(dictArgs))
+        self.layerData.num["conductor"] += 1
+
+    def addVia(self, dictArgs, matPrefix):
+        stack = self.layerData.stack
+        viaName = dictArgs["viaName"]["val"]
+        btmCondName = dictArgs["bottomCondName"]["val"]
+        topCondName = dictArgs["topCondName"]["val"]
+
+        if btmCondName not in stack:
+            raise optError("unDefCondName",btmCondName)
+        if topCondName not in stack:
+            raise optError("unDefCondName",topCondName)
+        btmCond = stack[btmCondName]
+        topCond = stack[topCondName]
+        if btmCond.z1<=topCond.z0:
+            range = [btmCond.z1, topCond.z0]
+            offset = btmCond.offset
+            origin = btmCond.origin
+        else:
+            range = [topCond.z1, btmCond.z0]
+            offset = topCond.offset
+            origin = topCond.origin
+
+        matName = matPrefix+viaName
+        h = range[1]-range[0]
+        cond = self.convResistivity(h,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"])
+
+        stack[viaName] = layerstack.StackLayer("via", matName, h, range[0], range[1], offset, origin, (btmCondName, topCondName))
+        self.layerData.materials[matName] = layerstack.Material("conductor", conductivity=cond, height=h, **self.getMatModel(dictArgs))
+        self.layerData.num["via"] += 1
+
+    def resolvePath(self, fileName):
+        if not os.path.isabs(fileName) and self.includeStack:
+            fileName = os.path.join(os.path.dirname(self.includeStack[-1]), fileName)
+        return os.path.realpath(fileName)
+
+    def getDefUnits(self):
+        return {dim:dData["defUnit"] for dim,dData in self.dims.items()}
+
+    def addInclude(self, dictArgs, matPrefix):
+        self.insertFragment(dictArgs["fileName"]["val"], None, matPrefix)
+
+    def addInherit(self, dictArgs, matPrefix):
+        self.insertFragment(dictArgs["fileName"]["val"], dictArgs["untilName"]["val"], matPrefix)
+
+    def addOverride(self, dictArgs, matPrefix):
+        # new material values for an entry defined earlier, geometry is kept
+        entryName = dictArgs["entryName"]["val"]
+        if entryName not in self.layerData.stack:
+            raise optError("unDefLayerName", entryName)
+        lData = self.layerData.stack[entryName]
+        mData = self.layerData.materials[lData.material]
+        vals = {}
+        if dictArgs["dielectric"]["val"] is not None:
+            vals["constant"] = self.convDefUnit("dielectric",dictArgs["dielectric"]["val"],dictArgs["dielectric"]["unit"])
+        if dictArgs["conductivity"]["val"] is not None:
+            vals["conductivity"] = self.convResistivity(mData.height,dictArgs["conductivity"]["val"],dictArgs["conductivity"]["unit"])
+        if dictArgs["tandel"]["val"] is not None:
+            vals["tandel"] = self.convDefUnit("tandel",dictArgs["tandel"]["val"],dictArgs["tandel"]["unit"])
+        if not vals:
+            raise optError("lessArgs", 2)
+        self.layerData.materials[lData.material] = mData.replace(**vals)
+
+    def getFragment(self, path, matPrefix):
+        # a fragment parsed on its own from the current heights and units;
+        # vias into entries outside it make it context dependent, then only
+        # its rows are kept and it is parsed inline
+        stat = os.stat(path)
+        defUnits = self.getDefUnits()
+        key = (path, stat.st_mtime_ns, stat.st_size, parser_version, matPrefix, tuple(sorted(defUnits.items())), tuple(self.crHg))
+        frag = fragment_cache.get(key)
+        if frag is not None:
+            fragment_cache.move_to_end(key)
+            if self.instrument is not None:
+                self.instrument.count("fragmentHits")
+            return frag
+
+        with open(path, mode='r') as f:
+            rows = [row.rstrip("\n") for row in f]
+        sub = LayerMapEditor(None, validate=False)
+        sub.setInstrument(self.instrument)
+        for dim,unit in defUnits.items():
+            sub.updateUnit(dim, unit)
+        sub.crHg = self.crHg
+        sub.includeStack = self.includeStack+[path]
+        states = {}
+        for i,row in enumerate(rows):
+            state = (i, sub.crHg, sub.getDefUnits())
+            entry = sub.importLine(i, row, matPrefix)
+            if entry[2] is not None and entry[2] not in states:
+                states[entry[2]] = state
+        # overrides would leak into an inherit cut made before them
+        isolated = not any(diag.code in ["unDefCondName","unDefLayerName"] for diag in sub.diagnostics) \
+            and not any(row.split()[:1]==["override"] for row in rows)
+        stack = sub.layerData.stack
+        if isolated:
+            entries = [(lName, lData, sub.layerData.materials[lData.material]) for lName,lData in stack.items()]
+            cuts = {lName:(i,)+states[lName] for i,lName in enumerate(stack) if lName in states}
+        else:
+            # rows that only parse in context (a via into outer conductors)
+            # define no entry here, so cut at the first row naming it
+            entries, cuts = (None, {})
+            for i,row in enumerate(rows):
+                lName = sub.getEntryName(row)
+                if lName is not None and lName not in cuts:
+                    cuts[lName] = (None, i, None, None)
+        frag = Fragment(path, rows, isolated, entries, cuts, (sub.crHg, sub.getDefUnits()), sub.diagnostics)
+        fragment_cache[key] = frag
+        if len(fragment_cache)>max_fragments:
+            fragment_cache.popitem(last=False)
+        return frag
+
+    def getEntryName(self, row):
+        # name an entry row defines, also when the row fails to build
+        tokens = row.split()
+        if not tokens or tokens[0] not in entry_cmds:
+            return None
+        try:
+            return self.transArgs(tokens[0], tokens[1:])[self.cmds[tokens[0]]["opts"][0]]["val"]
+        except (cmdError, optError):
+            return None
+
+    def insertFragment(self, fileName, untilName, matPrefix):
+        # include (untilName None) or inherit up to, excluding, untilName; the
+        # rows behave as if written in place of the command
+        path = self.resolvePath(fileName)
+        if path in self.includeStack:
+            raise optError("cyclicInclude", fileName)
+        if not os.path.isfile(path):
+            raise optError("unDefFile", fileName)
+        frag = self.getFragment(path, matPrefix)
+        if untilName is not None and untilName not in frag.cuts:
+            raise optError("unDefLayerName", untilName)
+        cutLine = frag.cuts[untilName][1] if untilName is not None else len(frag.rows)
+        if not frag.isolated:
+            self.insertFragmentRows(frag, cutLine, matPrefix)
+            return
+        cutIdx, _, crHg, defUnits = frag.cuts[untilName] if untilName is not None else (len(frag.entries), None)+frag.end
+        stack, materials, num = (self.layerData.stack, self.layerData.materials, self.layerData.num)
+        for lName,lData,mData in frag.entries[:cutIdx]:
+            stack[lName] = lData
+            materials[lData.material] = mData
+            num[num_keys[lData.type]] += 1
+        self.crHg = crHg
+        for dim,unit in defUnits.items():
+            self.updateUnit(dim, unit)
+        self.raiseFragmentDiags(frag, [diag for diag in frag.diagnostics if diag.line<cutLine])
+
+    def insertFragmentRows(self, frag, cutLine, matPrefix):
+        # context dependent fragment: parse its rows into this editor
+        orgDiags = self.diagnostics
+        self.diagnostics = []
+        self.includeStack.append(frag.fileName)
+        try:
+            for i,row in enumerate(frag.rows[:cutLine]):
+                self.importLine(i, row, matPrefix)
+        finally:
+            self.includeStack.pop()
+            fragDiags, self.diagnostics = (self.diagnostics, orgDiags)
+        self.raiseFragmentDiags(frag, fragDiags)
+
+    def raiseFragmentDiags(self, frag, diags):
+        # the first problem inside a fragment is reported on the include row
+        if diags:
+            raise optError("fragError", os.path.basename(frag.fileName), diags[0].line, diags[0].msg)
 
     def mergeLayers(self, layerName1, layerName2, newLayerName, layerData=None, matPrefix="T65_", overWrite=True):
-        inFlag = False
-        newLayerData = copy.deepcopy(layerData if layerData else self.layerData)
-        newRange = [newLayerData["stack"][layerName1]["range"][0],newLayerData["stack"][layerName2]["range"][1]]
+        return self.mergeLayersBatch([(layerName1, layerName2, newLayerName)], layerData=layerData, matPrefix=matPrefix, overWrite=overWrite)
+
+    def planMerge(self, layerData, layerName1, layerName2, newLayerName, matPrefix):
+        stack = layerData.stack
+        for lName in (layerName1, layerName2):
+            if lName not in stack:
+                raise mergeError("unDefLayerName", lName)
+        z0 = stack[layerName1].z0
+        z1 = stack[layerName2].z1
+
+        # dielectrics inside the range, in stack order, up to layerName2
+        delNames = []
+        newLData, newMat = (stack[layerName2], None)
         dpeSum = 0
-        for lName,lData in copy.deepcopy(newLayerData["stack"]).items():
-            if lData["type"]=="dielectric":
-                if newRange[0]<=lData["range"][0] and lData["range"][1]<=newRange[1]:
-                    eps = newLayerData["materials"][lData["material"]]["constant"]
-                    dpeSum += lData["height"]/eps
-                    if lName==layerName2:
-                        ht = newRange[1]-newRange[0]
-                        epsNew = ht/dpeSum
-                        newMatName = matPrefix+newLayerName
-                        newLayerData["stack"][lName]["height"] = ht
-                        newLayerData["stack"][lName]["range"] = newRange
-                        newLayerData["stack"][lName]["material"] = newMatName
-                        newLayerData["materials"][newMatName] = {
-                            "type":"dielectric",
-                            "constant":epsNew,
-                            "conductivity":np.nan,
-                            "height":ht,
-                            "tandel":np.nan}
-                        break
-                    else:
-                        del newLayerData["stack"][lName]
-        newLayerData["stack"] = {newLayerName if lName==layerName2 else lName:lData for lName,lData in newLayerData["stack"].items()}
+        for lName in layerData.getIndex(["dielectric"]).inside(z0, z1):
+            lData = stack[lName]
+            dpeSum += lData.height/layerData.materials[lData.material].constant
+            if lName==layerName2:
+                ht = z1-z0
+                newLData = layerstack.StackLayer("dielectric", matPrefix+newLayerName, ht, z0, z1)
+                newMat = layerstack.Material("dielectric", constant=ht/dpeSum, conductivity=np.nan, height=ht, tandel=np.nan)
+                break
+            delNames.append(lName)
+        return {
+            "names":(layerName1, layerName2, newLayerName),
+            "range":(min(z0,z1), max(z0,z1)),
+            "delNames":delNames,
+            "newLData":newLData,
+            "newMat":newMat}
+
+    def mergeLayersBatch(self, merges, layerData=None, matPrefix="T65_", overWrite=True):
+        if self.instrument is not None:
+            with self.instrument.phase("merge"):
+                return self.mergeLayersBatchImpl(merges, layerData, matPrefix, overWrite)
+        return self.mergeLayersBatchImpl(merges, layerData, matPrefix, overWrite)
+
+    def mergeLayersBatchImpl(self, merges, layerData, matPrefix, overWrite):
+        srcLayerData = self.getLayerStack(layerData)
+        stack = srcLayerData.stack
+        plans = [self.planMerge(srcLayerData, *merge, matPrefix) for merge in merges]
+
+        # disjoint ranges make every merge independent of the others, so the
+        # batch equals applying them one after another
+        sPlans = sorted(plans, key=lambda plan: plan["range"])
+        for plan1,plan2 in zip(sPlans[:-1], sPlans[1:]):
+            if plan2["range"][0]<plan1["range"][1]:
+                raise mergeError("overlapMerge", plan1["names"], plan2["names"])
+        consumed = {lName for plan in plans for lName in plan["delNames"]+[plan["names"][1]]}
+        newNames = set()
+        for plan in plans:
+            newLayerName = plan["names"][2]
+            if newLayerName in newNames or (newLayerName in stack and newLayerName not in consumed):
+                raise mergeError("dupLayerName", newLayerName)
+            newNames.add(newLayerName)
+
+        delNames = {lName for plan in plans for lName in plan["delNames"]}
+        renames = {plan["names"][1]:plan for plan in plans}
+        newStack = {}
+        for lName,lData in stack.items():
+            if lName in delNames:
+                continue
+            elif lName in renames:
+                newStack[renames[lName]["names"][2]] = renames[lName]["newLData"]
+            else:
+                newStack[lName] = lData
+
+        newLayerData = srcLayerData.copy()
+        newLayerData.stack = newStack
+        if self.instrument is not None:
+            self.countCopy(srcLayerData)
+            self.instrument.count("merges", len(plans))
+        for plan in plans:
+            if plan["newMat"] is not None:
+                newLayerData.materials[plan["newLData"].material] = plan["newMat"]
         newLayerData = self.delUnusedMat(layerData=newLayerData,overWrite=False)
         if overWrite:
             self.layerData = newLayerData
+            self.autoValidate()
+            self.commitHistory("merge")
         return newLayerData
 
     def delUnusedMat(self, layerData=None, overWrite=True):
-        newLayerData = copy.deepcopy(layerData if layerData else self.layerData)
-        usedMat = [lData["material"] for lData in newLayerData["stack"].values()]
-        for mName,mData in copy.deepcopy(newLayerData["materials"]).items():
-            if mName not in usedMat:
-                del newLayerData["materials"][mName]
+        newLayerData = self.getLayerStack(layerData).copy()
+        if self.instrument is not None:
+            self.countCopy(newLayerData)
+        usedMat = {lData.material for lData in newLayerData.stack.values()}
+        newLayerData.materials = {mName:mData for mName,mData in newLayerData.materials.items() if mName in usedMat}
         if overWrite:
             self.layerData = newLayerData
+            self.commitHistory("delUnusedMat")
         return newLayerData
 
+    def validateStack(self, layerData=None, rtol=1e-9):
+        if self.instrument is not None:
+            with self.instrument.phase("validate"):
+                return self.getLayerStack(layerData).validate(rtol)
+        return self.getLayerStack(layerData).validate(rtol)
+
+    def autoValidate(self):
+        self.findings = self.validateStack() if self.validate else []
+
+    def trackHistory(self, label=None, maxDelta=0.25, maxCached=4):
+        # snapshot the current stack and every overwriting edit from now on
+        from . import history
+        self.history = history.StackHistory(self.getHistoryStack(), label, maxDelta, maxCached)
+        return self.history
+
+    def getHistoryStack(self):
+        # snapshots carry the default units their values are expressed in
+        self.layerData.unit = {dim:self.dims[dim]["defUnit"] for dim in ["length","conductivity"]}
+        return self.layerData
+
+    def commitHistory(self, label=None):
+        if self.history is not None:
+            return self.history.commit(self.getHistoryStack(), label)
+
+    def setHistoryStack(self, layerData):
+        self.layerData = layerData
+        for dim,unit in layerData.unit.items():
+            if unit is not None:
+                self.updateUnit(dim, unit)
+        self.autoValidate()
+        return layerData
+
+    def undo(self):
+        return self.setHistoryStack(self.history.undo())
+
+    def redo(self):
+        return self.setHistoryStack(self.history.redo())
+
+    def checkout(self, name):
+        return self.setHistoryStack(self.history.checkout(name))
+
+    def diffStack(self, other, layerData=None, rtol=1e-9, atol=0.0):
+        # changes from this stack (or layerData) to other, an editor or stack
+        from . import diff
+        other = other.layerData if isinstance(other, LayerMapEditor) else other
+        return diff.diffStacks(self.getLayerStack(layerData), other, rtol, atol)
+
+    def calcEffPermittivity(self, z0, z1, layerData=None):
+        return self.getLayerStack(layerData).getPermittivityProfile().effective(z0, z1)
+
+    def evalMaterials(self, temperature, frequency, names=None, unit=None, layerData=None, fLow=None, fHigh=None):
+        # sigma (in unit, default the conductivity unit), eps and tandel of
+        # every material (or names) as (materials, temperature, frequency)
+        # arrays; temperature/frequency are in the default units, the
+        # conductivities go to S/m and back through convResistivity. fLow/
+        # fHigh default to matmodel.def_freq_low/def_freq_high
+        from . import matmodel
+        fLow = fLow if fLow is not None else matmodel.def_freq_low
+        fHigh = fHigh if fHigh is not None else matmodel.def_freq_high
+        layerData = self.getLayerStack(layerData)
+        unit1 = self.dims["conductivity"]["defUnit"]
+        unit2 = unit if unit else unit1
+        temperature = self.um.convUnitArr(np.atleast_1d(temperature), self.dims["temperature"]["defUnit"], "K")
+        frequency = self.um.convUnitArr(np.atleast_1d(frequency), self.dims["frequency"]["defUnit"], "Hz")
+        return matmodel.evalMaterials(layerData.materials, temperature, frequency, names,
+            lambda t,v: self.convResistivity(t, v, unit1, "S/m"),
+            lambda t,v: self.convResistivity(t, v, "S/m", unit2), fLow, fHigh)
+
     def changeMatCond(self, unit):
-        for mData in self.layerData["materials"].values():
-            h = mData["height"]
-            mData["conductivity"] = self.convResistivity(t=h,val=mData["conductivity"],unit2=unit)
+        materials = self.layerData.materials
+        h = np.array([mData.height for mData in materials.values()], dtype=float)
+        cond = np.array([mData.conductivity for mData in materials.values()], dtype=float)
+        cond = self.getConvPlan(self.dims["conductivity"]["defUnit"], unit)(h, cond)
+        if self.instrument is not None:
+            self.instrument.count("conversions", len(h))
+        for (mName,mData),c in zip(list(materials.items()), cond.tolist()):
+            materials[mName] = mData.replace(conductivity=c)
         self.updateUnit("conductivity",unit)
+        self.commitHistory("changeMatCond")
 
-    def plotStack(self, scaled=True, layerColor=("green",0.2), condColor=("orange",1), viaColor=("yellow",0.5)):
-        maxHg = np.max([lData["range"] for lData in self.layerData["stack"].values()])
+    def calcPlotLayout(self, scaled=True):
+        # plotted range, position and width of every stack entry; dielectrics
+        # are stacked (each h0 high when scaled), conductors/vias follow them
+        stack = self.layerData.stack
+        maxHg = np.max([lData.range for lData in stack.values()])
         w0 = maxHg/5
-        h0 = maxHg/self.layerData["num"]["layer"]
-        figSize = 50
-        maxFontSize = 20
+        h0 = maxHg/self.layerData.num["layer"]
 
-        pltLayerStack = copy.deepcopy(self.layerData["stack"])
+        pltLayerStack = {lName:{"type":lData.type,"range":list(lData.range)} for lName,lData in stack.items()}
+        condIndex = self.layerData.getIndex(["conductor","via"])
         pltCrHg = 0
-        for lName,lData in self.layerData["stack"].items():
-            if lData["type"]=="dielectric":
-                ly0,ly1 = lData["range"]
+        for lName,lData in stack.items():
+            if lData.type=="dielectric":
+                ly0,ly1 = lData.z0,lData.z1
                 h = h0 if scaled else ly1-ly0
                 lRatio = h/(ly1-ly0)
                 pltLayerStack[lName]["range"] = (pltCrHg,pltCrHg+h)
 
-                for cName,cData in self.layerData["stack"].items():
-                    if cData["type"] in ["conductor","via"]:
-                        cy0,cy1 = cData["range"]
-                        if ly1<cy0 or cy1<ly0:
-                            continue
-                        if cy0>=ly0:
-                            pltLayerStack[cName]["range"][0] = pltLayerStack[lName]["range"][0]+(cy0-ly0)*lRatio
-                        if cy1<=ly1:
-                            pltLayerStack[cName]["range"][1] = pltLayerStack[lName]["range"][1]-(ly1-cy1)*lRatio
+                for cName in condIndex.overlaps(ly0, ly1):
+                    cy0,cy1 = stack[cName].z0,stack[cName].z1
+                    if cy0>=ly0:
+                        pltLayerStack[cName]["range"][0] = pltLayerStack[lName]["range"][0]+(cy0-ly0)*lRatio
+                    if cy1<=ly1:
+                        pltLayerStack[cName]["range"][1] = pltLayerStack[lName]["range"][1]-(ly1-cy1)*lRatio
                 pltCrHg += h
 
+        # vias overlapping an earlier via (in plotted coordinates) shift right
+        viaNames = [lName for lName,lData in pltLayerStack.items() if lData["type"]=="via"]
+        viaIndex = layerstack.IntervalIndex(viaNames, [pltLayerStack[vName]["range"][0] for vName in viaNames], [pltLayerStack[vName]["range"][1] for vName in viaNames])
+        numDpls = {vName:np.count_nonzero(viaIndex.queryOverlaps(*pltLayerStack[vName]["range"])<i) for i,vName in enumerate(viaNames)}
         for lName,lData in pltLayerStack.items():
             if lData["type"]=="dielectric":
                 lData["pos"] = (0,lData["range"][0])
-                lData["width"] = w0
-                lData["color"] = layerColor
             elif lData["type"]=="conductor":
                 lData["pos"] = (w0,lData["range"][0])
-                lData["width"] = w0
-                lData["color"] = condColor
             elif lData["type"]=="via":
-                numDpl = 0
-                for vName,vData in pltLayerStack.items():
-                    if vData["type"]=="via":
-                        if vName==lName:
-                            break
-                        elif lData["range"][1]<vData["range"][0] or vData["range"][1]<lData["range"][0]:
-                            pass
-                        else:
-                            numDpl += 1
-                lData["pos"] = (2*w0+w0*numDpl,lData["range"][0])
-                lData["width"] = w0
-                lData["color"] = viaColor
+                lData["pos"] = (2*w0+w0*numDpls[lName],lData["range"][0])
+            lData["width"] = w0
+        return pltLayerStack, maxHg
+
+    def getPlotLabels(self, lName):
+        # (layer label, top boundary label or None)
+        lData = self.layerData.stack[lName]
+        mData = self.layerData.materials[lData.material]
+        lenUnit = self.dims["length"]["defUnit"]
+        if lData.type=="dielectric":
+            matVal = f'eps{mData.constant:.2f}'
+            hgVal = f'{lData.z1:.3f}{lenUnit}'
+        else:
+            matVal = f'{mData.conductivity:.3f}{self.dims["conductivity"]["defUnit"]}'
+            hgVal = None
+        return f'{lName}:{matVal},h{lData.height:.3f}{lenUnit}', hgVal
+
+    def rasterizeStack(self, z, x=None, fileName=None, chunkRows=4096):
+        # sample eps/sigma/tandel on a z grid (dielectric profile) or a z-by-x
+        # cross section where conductors and vias sit in the columns plotStack
+        # gives them (unscaled). Overlapping boxes are painted in stack order,
+        # so a later entry wins; uncovered points are nan. With fileName the
+        # result is a (3, nz[, nx]) float64 memmap in eps/sigma/tandel order,
+        # filled chunkRows z rows at a time. z and x must be strictly
+        # monotonic; descending grids are sampled ascending and written
+        # through reversed views
+        stack = self.layerData.stack
+        materials = self.layerData.materials
+        z = np.asarray(z, dtype=float)
+        shape = (len(z),) if x is None else (len(z), len(x))
+        if fileName is None:
+            out = np.empty((3,)+shape)
+        else:
+            out = np.lib.format.open_memmap(fileName, mode="w+", dtype=float, shape=(3,)+shape)
+        ret = out
+        z, zRev = self.getAscendingGrid("z", z)
+        if zRev:
+            out = out[:,::-1]
+
+        dNames = sorted((lName for lName,lData in stack.items() if lData.type=="dielectric"), key=lambda lName: stack[lName].z0)
+        dz0 = np.array([stack[lName].z0 for lName in dNames], dtype=float)
+        dz1 = np.array([stack[lName].z1 for lName in dNames], dtype=float)
+        dVals = np.array([[materials[stack[lName].material].constant, materials[stack[lName].material].conductivity, materials[stack[lName].material].tandel] for lName in dNames], dtype=float).reshape(-1,3)
+        dVals = np.vstack((dVals, np.full((1,3), np.nan)))
+
+        if x is not None:
+            x, xRev = self.getAscendingGrid("x", np.asarray(x, dtype=float))
+            if xRev:
+                out = out[:,:,::-1]
+            pltLayerStack, _ = self.calcPlotLayout(scaled=False)
+            bNames = [lName for lName,lData in stack.items() if lData.type in ["conductor","via"]]
+            boxIndex = layerstack.IntervalIndex(bNames, [stack[lName].z0 for lName in bNames], [stack[lName].z1 for lName in bNames])
+            boxes = {}
+            for lName in bNames:
+                pos, w = pltLayerStack[lName]["pos"][0], pltLayerStack[lName]["width"]
+                mData = materials[stack[lName].material]
+                boxes[lName] = (
+                    np.searchsorted(z, stack[lName].z0, side="left"), np.searchsorted(z, stack[lName].z1, side="left"),
+                    np.searchsorted(x, pos, side="left"), np.searchsorted(x, pos+w, side="left"),
+                    (np.nan, mData.conductivity, np.nan))
+
+        for r0 in range(0, len(z), chunkRows):
+            r1 = min(r0+chunkRows, len(z))
+            zc = z[r0:r1]
+            idx = np.searchsorted(dz0, zc, side="right")-1
+            inside = (idx>=0)&(zc<=dz1[np.maximum(idx,0)])
+            vals = dVals[np.where(inside, idx, -1)]
+            for k in range(3):
+                out[k,r0:r1] = vals[:,k] if x is None else vals[:,k,np.newaxis]
+            if x is None or r0==r1:
+                continue
+            for lName in boxIndex.overlaps(zc[0], zc[-1]):
+                zlo, zhi, xlo, xhi, bVals = boxes[lName]
+                zlo, zhi = max(zlo,r0), min(zhi,r1)
+                if zlo<zhi and xlo<xhi:
+                    for k in range(3):
+                        out[k,zlo:zhi,xlo:xhi] = bVals[k]
+            if fileName is not None:
+                ret.flush()
+        return ret
+
+    def getAscendingGrid(self, axis, grid):
+        # (ascending grid, whether it was reversed)
+        if grid.ndim!=1 or np.isnan(grid).any():
+            raise rasterError("inValidGrid", axis)
+        if len(grid)>1 and grid[0]>grid[-1]:
+            grid = grid[::-1]
+            rev = True
+        else:
+            rev = False
+        if np.any(np.diff(grid)<=0):
+            raise rasterError("unsortedGrid", axis)
+        return grid, rev
+
+    def plotStack(self, scaled=True, layerColor=("green",0.2), condColor=("orange",1), viaColor=("yellow",0.5)):
+        # matplotlib is only imported once something is drawn
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+
+        figSize = 50
+        maxFontSize = 20
+        colors = {"dielectric":layerColor, "conductor":condColor, "via":viaColor}
+        pltLayerStack, maxHg = self.calcPlotLayout(scaled)
 
         fig = plt.figure(figsize=(figSize,figSize))
         ax = fig.add_subplot(111)
         for lName,lData in pltLayerStack.items():
             fontSize = 5000*(lData["range"][1]-lData["range"][0])/maxHg
             fontSize = fontSize if fontSize<maxFontSize else maxFontSize
+            label, hgLabel = self.getPlotLabels(lName)
             if lData["type"]=="dielectric":
-                matVal = f'eps{self.layerData["materials"][lData["material"]]["constant"]:.2f}'
-                plt.text(lData["pos"][0]-lData["width"]/2,lData["range"][1],f'{self.layerData["stack"][lName]["range"][1]:.3f}{self.dims["length"]["defUnit"]}',size=fontSize)
+                plt.text(lData["pos"][0]-lData["width"]/2,lData["range"][1],hgLabel,size=fontSize)
                 plt.hlines(lData["range"][0],lData["pos"][0]-lData["width"]/2,lData["pos"][0],linewidths=0.5,color="black",alpha=1.0)
                 plt.hlines(lData["range"][1],lData["pos"][0]-lData["width"]/2,lData["pos"][0],linewidths=0.5,color="black",alpha=1.0)
-            elif lData["type"]=="conductor":
-                matVal = f'{self.layerData["materials"][lData["material"]]["conductivity"]:.3f}{self.dims["conductivity"]["defUnit"]}'
-            elif lData["type"]=="via":
-                matVal = f'{self.layerData["materials"][lData["material"]]["conductivity"]:.3f}{self.dims["conductivity"]["defUnit"]}'
 
             r = patches.Rectangle(
                 xy=lData["pos"],
                 width=lData["width"],
                 height=lData["range"][1]-lData["range"][0],
-                color=lData["color"][0],
-                alpha=lData["color"][1])
+                color=colors[lData["type"]][0],
+                alpha=colors[lData["type"]][1])
             ax.add_patch(r)
 
             plt.text(
                 x=lData["pos"][0]+lData["width"]/2,
                 y=lData["pos"][1]+(lData["range"][1]-lData["range"][0])/2,
-                s=f'{lName}:{matVal},h{self.layerData["stack"][lName]["height"]:.3f}{self.dims["length"]["defUnit"]}',
+                s=label,
                 size=fontSize,
                 va="center", ha="center")
         plt.axis('scaled')
@@ -430,45 +1183,181 @@ class LayerMapEditor():
         ax.axes.yaxis.set_visible(False)
         plt.show()
 
+    def renderStack(self, fname, format=None, scaled=True, layerColor=("green",0.2), condColor=("orange",1), viaColor=("yellow",0.5),
+                    labels=True, maxLabels=None, dpi=72, width=12, rowHeight=0.2, minFontSize=2, maxFontSize=20):
+        # headless (Agg, no pyplot) rendering to a file name or binary buffer;
+        # all rectangles go through one PolyCollection, all boundary ticks
+        # through one LineCollection and all labels through one path of cached
+        # glyphs, figure height follows the dielectric count. Labels whose
+        # font would be below minFontSize are left out. maxLabels is a lossy
+        # mode: stacks with more entries are drawn without labels, with a
+        # warning. png (the default) is encoded by writePNG, other formats by
+        # savefig
+        import matplotlib.colors as mcolors
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import PolyCollection, LineCollection
+        from matplotlib.patches import PathPatch
+
+        colors = {lType:mcolors.to_rgba(*color) for lType,color in
+                  (("dielectric",layerColor), ("conductor",condColor), ("via",viaColor))}
+        pltLayerStack, maxHg = self.calcPlotLayout(scaled)
+        lNames = list(pltLayerStack.keys())
+        lDatas = list(pltLayerStack.values())
+        x0 = np.array([lData["pos"][0] for lData in lDatas])
+        w = np.array([lData["width"] for lData in lDatas])
+        y0 = np.array([lData["range"][0] for lData in lDatas], dtype=float)
+        y1 = np.array([lData["range"][1] for lData in lDatas], dtype=float)
+        isDiel = np.array([lData["type"]=="dielectric" for lData in lDatas])
+
+        verts = np.stack([np.column_stack((x0,y0)), np.column_stack((x0+w,y0)), np.column_stack((x0+w,y1)), np.column_stack((x0,y1))], axis=1)
+        dx0, dw, dy0, dy1 = x0[isDiel], w[isDiel], y0[isDiel], y1[isDiel]
+        segs = np.concatenate([
+            np.stack([np.column_stack((dx0-dw/2,dy0)), np.column_stack((dx0,dy0))], axis=1),
+            np.stack([np.column_stack((dx0-dw/2,dy1)), np.column_stack((dx0,dy1))], axis=1)])
+
+        xlim = (np.min(x0-w/2), np.max(x0+w))
+        ylim = (min(np.min(y0), 0), np.max(y1))
+        figHeight = min(max(np.count_nonzero(isDiel)*rowHeight, 2), 60000/dpi)
+        fig = Figure(figsize=(width,figHeight), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0,0,1,1])
+        ax.add_collection(PolyCollection(verts, facecolors=[colors[lData["type"]] for lData in lDatas], edgecolors="none"))
+        ax.add_collection(LineCollection(segs, linewidths=0.5, colors="black"))
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+        ax.set_axis_off()
+
+        if labels and maxLabels is not None and len(lNames)>maxLabels:
+            warnings.warn(f"renderStack: {len(lNames)} entries exceed maxLabels={maxLabels}, drawing without labels")
+            labels = False
+        if labels:
+            # fit the box height and, at ~0.6em per character, the box width
+            yPts = figHeight*72/(ylim[1]-ylim[0])
+            xPts = width*72/(xlim[1]-xlim[0])
+            fontSizes = np.minimum((y1-y0)*yPts*0.6, maxFontSize)
+            items = []
+            for i in np.flatnonzero(fontSizes>=minFontSize):
+                label, hgLabel = self.getPlotLabels(lNames[i])
+                fontSize = min(fontSizes[i], w[i]*xPts/(0.6*len(label)))
+                if fontSize<minFontSize:
+                    continue
+                items.append((label, x0[i]+w[i]/2, (y0[i]+y1[i])/2, fontSize, "center", "center"))
+                if hgLabel:
+                    items.append((hgLabel, x0[i]-w[i]/2, y1[i], fontSize, "left", "top"))
+            if items:
+                # add_artist: the limits are set, add_patch would walk every curve for them
+                ax.add_artist(PathPatch(labelPath(items, xPts, yPts), facecolor="black", edgecolor="none", linewidth=0))
+        if format is None and isinstance(fname, (str, os.PathLike)):
+            format = os.path.splitext(fname)[1][1:].lower() or None
+        if format in (None, "png"):
+            fig.canvas.draw()
+            writePNG(fname, np.asarray(fig.canvas.buffer_rgba()), dpi)
+        else:
+            fig.savefig(fname, format=format, dpi=dpi)
+        return fig
+
 class cmdError(Exception):
     pass
 class optError(Exception):
     pass
+class mergeError(Exception):
+    pass
+class rasterError(Exception):
+    pass
+
+# Define Diagnostics ###########################################################
+err_msgs = {
+    "unDefCmd"          :'Undefined command "{2}" at {1} line.',
+    "lessArgs"          :'At least {2} arguments are required at {1} line.',
+    "overArgs"          :'Too many arguments at {1} line, maximum is {2}.',
+    "inValidUnit"       :'Invalid unit "{3}" at {1} line, {2} argument.',
+    "unDefCondName"     :'Undefined conductor name "{2}" at {1} line.',
+    "unDefDimName"      :'Undefined dimension name "{2}" at {1} line.',
+    "inValidUnitName"   :'Invalid unit name "{2}" at {1} line.',
+    "unDefLayerName"    :'Undefined layer name "{2}" at {1} line.',
+    "inValidValue"      :'Invalid value "{2}" for {3} at {1} line.',
+    "unDefFile"         :'Layermap file "{2}" not found at {1} line.',
+    "cyclicInclude"     :'"{2}" includes itself at {1} line.',
+    "fragError"         :'In "{2}" line {3}: {4} (included at {1} line).'
+}
+err_kinds = {"cmdError":"Command Error", "optError":"Option Error"}
+
+# outcome of reload(): full is set when everything was re-parsed, reparsed
+# counts the rows that went through the parser
+ReloadReport = namedtuple("ReloadReport", ["full","added","removed","modified","shifted","reparsed","diagnostics"])
+
+# a parsed include/inherit file: entries as (name, StackLayer, Material) in
+# stack order, cuts maps an entry name to (entry index, row, crHg, default
+# units) just before its row and end is (crHg, default units) after the last row.
+# When the fragment is not isolated entries is None and cuts only holds the
+# row of each name (None for the rest), its rows are parsed again in place
+Fragment = namedtuple("Fragment", ["fileName","rows","isolated","entries","cuts","end","diagnostics"])
+
+class Diagnostic(namedtuple("Diagnostic", ["line","column","code","kind","args"])):
+    __slots__ = ()
+
+    @classmethod
+    def fromError(cls, e, line, row):
+        # point at the first offending token found on the row, else the command
+        tokens = [(m.group(), m.start()) for m in re.finditer(r'\S+', row)]
+        column = tokens[0][1] if tokens else 0
+        for arg in e.args[1:]:
+            cols = [col for tok,col in tokens[1:] if tok==arg or (type(arg) is float and cls.tokenVal(tok)==arg)]
+            if cols:
+                column = cols[0]
+                break
+        return cls(line, column, e.args[0], type(e).__name__, e.args[1:])
+
+    @staticmethod
+    def tokenVal(tok):
+        try:
+            return float(tok.replace(',',''))
+        except ValueError:
+            return None
+
+    @property
+    def msg(self):
+        return err_msgs[self.code].format(self.code, self.line, *self.args)
+
+    def __str__(self):
+        return f"{err_kinds[self.kind]}: {self.msg}"
 
 if __name__=='__main__':
     lme = LayerMapEditor("./emx_layermap/tsmc65n.txt")
     lme.plotStack()
-    lme.mergeLayers(layerName1="FOX",layerName2="ILD0b",newLayerName="IMD1A")
-    lme.mergeLayers(layerName1="IMD1a",layerName2="IMD1b",newLayerName="IMD1B")
+    lme.mergeLayersBatch([
+        ("FOX","ILD0b","IMD1A"),
+        ("IMD1a","IMD1b","IMD1B"),
 
-    lme.mergeLayers(layerName1="IMD1c",layerName2="IMD2a",newLayerName="IMD2A")
-    lme.mergeLayers(layerName1="IMD2b",layerName2="IMD2b",newLayerName="IMD2B")
+        ("IMD1c","IMD2a","IMD2A"),
+        ("IMD2b","IMD2b","IMD2B"),
 
-    lme.mergeLayers(layerName1="IMD2c",layerName2="IMD3a",newLayerName="IMD3A")
-    lme.mergeLayers(layerName1="IMD3b",layerName2="IMD3b",newLayerName="IMD3B")
+        ("IMD2c","IMD3a","IMD3A"),
+        ("IMD3b","IMD3b","IMD3B"),
 
-    lme.mergeLayers(layerName1="IMD3c",layerName2="IMD4a",newLayerName="IMD4A")
-    lme.mergeLayers(layerName1="IMD4b",layerName2="IMD4b",newLayerName="IMD4B")
+        ("IMD3c","IMD4a","IMD4A"),
+        ("IMD4b","IMD4b","IMD4B"),
 
-    lme.mergeLayers(layerName1="IMD4c",layerName2="IMD5a",newLayerName="IMD5A")
-    lme.mergeLayers(layerName1="IMD5b",layerName2="IMD5b",newLayerName="IMD5B")
+        ("IMD4c","IMD5a","IMD5A"),
+        ("IMD5b","IMD5b","IMD5B"),
 
-    lme.mergeLayers(layerName1="IMD5c",layerName2="IMD6a",newLayerName="IMD6A")
-    lme.mergeLayers(layerName1="IMD6b",layerName2="IMD6b",newLayerName="IMD6B")
+        ("IMD5c","IMD6a","IMD6A"),
+        ("IMD6b","IMD6b","IMD6B"),
 
-    lme.mergeLayers(layerName1="IMD6c",layerName2="IMD7a",newLayerName="IMD7A")
-    lme.mergeLayers(layerName1="IMD7b",layerName2="IMD7b",newLayerName="IMD7B")
-    lme.mergeLayers(layerName1="IMD7c",layerName2="IMD7c",newLayerName="IMD7C")
+        ("IMD6c","IMD7a","IMD7A"),
+        ("IMD7b","IMD7b","IMD7B"),
+        ("IMD7c","IMD7c","IMD7C"),
 
-    lme.mergeLayers(layerName1="IMD8a",layerName2="IMD8a",newLayerName="IMD8A")
-    lme.mergeLayers(layerName1="IMD8b",layerName2="IMD8c",newLayerName="IMD8B")
+        ("IMD8a","IMD8a","IMD8A"),
+        ("IMD8b","IMD8c","IMD8B"),
 
-    lme.mergeLayers(layerName1="IMD8d",layerName2="IMD9a",newLayerName="IMD9A")
-    lme.mergeLayers(layerName1="IMD9b",layerName2="IMD9c",newLayerName="IMD9B")
+        ("IMD8d","IMD9a","IMD9A"),
+        ("IMD9b","IMD9c","IMD9B"),
 
-    lme.mergeLayers(layerName1="PASS1",layerName2="PASS4",newLayerName="PASS1A")
-    lme.mergeLayers(layerName1="PASS5a",layerName2="PASS5a",newLayerName="PASS1B")
-    lme.mergeLayers(layerName1="PASS5b",layerName2="PASS6",newLayerName="PASS1C")
+        ("PASS1","PASS4","PASS1A"),
+        ("PASS5a","PASS5a","PASS1B"),
+        ("PASS5b","PASS6","PASS1C")])
 
     lme.changeMatCond("S/m")
     lme.plotStack()
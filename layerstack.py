@@ -0,0 +1,541 @@
+from collections import namedtuple
+import numpy as np
+
+# Define Column Layout #########################################################
+layer_types = ["dielectric", "conductor", "via"]
+material_types = ["dielectric", "conductor"]
+layer_codes = {lType:i for i,lType in enumerate(layer_types)}
+# flat per-entry table of toColumns(), material values joined onto the entry
+export_columns = ["name","type","material","z0","z1","height","offset","origin","eps","sigma","tandel"]
+stack_dtype = np.dtype([("type","i1"), ("material","i4"), ("height","f8"), ("z0","f8"), ("z1","f8"), ("offset","f8"), ("origin","f8"), ("bottom","i4"), ("top","i4")])
+material_dtype = np.dtype([("type","i1"), ("constant","f8"), ("conductivity","f8"), ("height","f8"), ("tandel","f8"), ("tcr","f8"), ("tcr2","f8"), ("tempRef","f8"), ("freqRef","f8")])
+
+# Define Stack Records #########################################################
+# Records are shared between LayerStack copies (and snapshots, fragments), so
+# nothing edits one in place; a new record is built with replace() instead.
+# Item access (rec["range"], rec.keys(), ...) presents the old nested-dict
+# shape read-only, item assignment raises.
+class Record():
+    __slots__ = ()
+
+    def keys(self):
+        return []
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, val):
+        raise TypeError(f"{type(self).__name__} records are shared between stacks, use replace({key}=...)")
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.toDict()==other.toDict()
+        if isinstance(other, dict):
+            return self.toDict()=={key:(list(val) if type(val) in (list, tuple) else val) for key,val in other.items()}
+        return NotImplemented
+
+    def isSame(self, other):
+        # slot-wise equality that treats nan as equal to nan
+        if type(other) is not type(self):
+            return False
+        for slot in type(self).__slots__:
+            val, oVal = getattr(self, slot), getattr(other, slot)
+            if val!=oVal and not (val!=val and oVal!=oVal):
+                return False
+        return True
+
+    def get(self, key, default=None):
+        return self[key] if key in self.keys() else default
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        new = object.__new__(type(self))
+        for slot in type(self).__slots__:
+            setattr(new, slot, getattr(self, slot))
+        return new
+
+    def replace(self, **kwargs):
+        new = self.copy()
+        for key,val in kwargs.items():
+            setattr(new, key, val)
+        return new
+
+    def toDict(self):
+        return {key:(list(val) if type(val) in (list, tuple) else val) for key,val in self.items()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())})"
+
+class StackLayer(Record):
+    # connects holds the (bottom, top) entry names of a via; it is not part
+    # of the dict view
+    __slots__ = ("type","material","height","z0","z1","offset","origin","connects")
+
+    def __init__(self, type, material, height, z0, z1, offset=None, origin=None, connects=None):
+        self.type = type
+        self.material = material
+        self.height = height
+        self.z0 = z0
+        self.z1 = z1
+        self.offset = offset
+        self.origin = origin
+        self.connects = connects
+
+    @property
+    def range(self):
+        # a tuple, so rec["range"][0] = ... fails instead of editing a copy
+        return (self.z0, self.z1)
+
+    @range.setter
+    def range(self, val):
+        self.z0, self.z1 = val
+
+    def keys(self):
+        if self.type=="dielectric":
+            return ["type","material","height","range"]
+        return ["type","material","height","range","offset","origin"]
+
+    @classmethod
+    def fromDict(cls, lData):
+        connects = lData.connects if isinstance(lData, StackLayer) else None
+        return cls(lData["type"], lData["material"], lData["height"], lData["range"][0], lData["range"][1], lData.get("offset"), lData.get("origin"), connects)
+
+class Material(Record):
+    # tcr/tcr2 (per K, K^-2) at tempRef (K) and the dispersion reference
+    # frequency freqRef (Hz) feed matmodel.evalMaterials; like connects they
+    # are not part of the dict view
+    __slots__ = ("type","constant","conductivity","height","tandel","tcr","tcr2","tempRef","freqRef")
+
+    def __init__(self, type, constant=np.nan, conductivity=np.nan, height=np.nan, tandel=np.nan, tcr=0.0, tcr2=0.0, tempRef=np.nan, freqRef=np.nan):
+        self.type = type
+        self.constant = constant
+        self.conductivity = conductivity
+        self.height = height
+        self.tandel = tandel
+        self.tcr = tcr
+        self.tcr2 = tcr2
+        self.tempRef = tempRef
+        self.freqRef = freqRef
+
+    def keys(self):
+        if self.type=="dielectric":
+            return ["type","constant","conductivity","height","tandel"]
+        return ["type","conductivity","height"]
+
+    @classmethod
+    def fromDict(cls, mData):
+        model = (mData.tcr, mData.tcr2, mData.tempRef, mData.freqRef) if isinstance(mData, Material) else ()
+        return cls(mData["type"], mData.get("constant", np.nan), mData["conductivity"], mData["height"], mData.get("tandel", np.nan), *model)
+
+# Define Interval Index ########################################################
+class IntervalIndex():
+    # nested containment list: an interval inside another one goes to that
+    # one's sublist, so within every list both edges ascend and the hits of
+    # a query are one slice found by binary search. Only hits with a sublist
+    # are descended into, so a query costs a binary search per visited list
+    # plus the output, also when a full height via or substrate contains
+    # everything else. The lists are laid out one after another in flat
+    # arrays; an inverted interval (z1<z0) is indexed by its span
+    def __init__(self, names, z0, z1):
+        self.names = list(names)
+        z0 = np.asarray(z0, dtype=float)
+        z1 = np.asarray(z1, dtype=float)
+        lo, hi = (np.minimum(z0, z1), np.maximum(z0, z1))
+        order = np.lexsort((-hi, lo))
+        his = hi[order].tolist()
+        kids, stack = ({}, [])
+        for i in range(len(order)):
+            while stack and his[stack[-1]]<his[i]:
+                stack.pop()
+            kids.setdefault(stack[-1] if stack else -1, []).append(i)
+            stack.append(i)
+        flat = list(kids.get(-1, []))
+        self.nTop = len(flat)
+        childLo, childHi = ([0]*len(order), [0]*len(order))
+        for i in flat:
+            if i in kids:
+                childLo[i] = len(flat)
+                flat.extend(kids[i])
+                childHi[i] = len(flat)
+        flat = np.array(flat, dtype=np.intp)
+        self.pos = order[flat]
+        self.z0 = lo[self.pos]
+        self.z1 = hi[self.pos]
+        self.childLo = np.array(childLo, dtype=np.intp)[flat]
+        self.childHi = np.array(childHi, dtype=np.intp)[flat]
+        self.hasKids = self.childHi>self.childLo
+
+    def collect(self, z0, z1, inside):
+        # flat indices of the hits, list by list
+        hits = []
+        lists = [(0, self.nTop)]
+        while lists:
+            lo, hi = lists.pop()
+            i0 = lo+np.searchsorted(self.z1[lo:hi], z0, side="left")
+            i1 = lo+np.searchsorted(self.z0[lo:hi], z1, side="right")
+            if i0>=i1:
+                continue
+            if inside:
+                # both edges ascend, so the contained ones are a sub-slice
+                j0 = lo+np.searchsorted(self.z0[lo:hi], z0, side="left")
+                j1 = lo+np.searchsorted(self.z1[lo:hi], z1, side="right")
+                if j0<j1:
+                    hits.append(self.pos[j0:j1])
+            else:
+                hits.append(self.pos[i0:i1])
+            for i in i0+np.flatnonzero(self.hasKids[i0:i1]):
+                lists.append((self.childLo[i], self.childHi[i]))
+        return np.sort(np.concatenate(hits)) if hits else np.empty(0, dtype=np.intp)
+
+    def queryOverlaps(self, z0, z1):
+        # positions (in insertion order) of intervals touching [z0, z1]
+        return self.collect(z0, z1, False)
+
+    def queryInside(self, z0, z1):
+        # positions (in insertion order) of intervals within [z0, z1]
+        return self.collect(z0, z1, True)
+
+    @classmethod
+    def fromStack(cls, stack, types=None):
+        lDatas = [(lName,lData) for lName,lData in stack.items() if types is None or lData.type in types]
+        return cls([lName for lName,_ in lDatas], [lData.z0 for _,lData in lDatas], [lData.z1 for _,lData in lDatas])
+
+    def overlaps(self, z0, z1):
+        return [self.names[pos] for pos in self.queryOverlaps(z0, z1)]
+
+    def inside(self, z0, z1):
+        return [self.names[pos] for pos in self.queryInside(z0, z1)]
+
+# Define Stack Validation ######################################################
+finding_msgs = {
+    "negHeight"     :'"{0}" has a negative height ({1:.6g} to {2:.6g}).',
+    "danglingVia"   :'Via "{0}" connects to undefined entry "{1}".',
+    "condOverlap"   :'Conductors "{0}" and "{1}" overlap from {2:.6g} to {3:.6g}.',
+    "viaCross"      :'Via "{0}" crosses conductor "{1}" from {2:.6g} to {3:.6g}.',
+    "dielGap"       :'Gap between dielectrics "{0}" and "{1}" from {2:.6g} to {3:.6g}.',
+    "dielOverlap"   :'Dielectrics "{0}" and "{1}" overlap from {2:.6g} to {3:.6g}.'
+}
+
+class Finding(namedtuple("Finding", ["code","names","z0","z1"])):
+    __slots__ = ()
+
+    @property
+    def msg(self):
+        return finding_msgs[self.code].format(*self.names, self.z0, self.z1)
+
+    def __str__(self):
+        return f"Stack Warning: {self.msg}"
+
+def validateStack(stack, rtol=1e-9):
+    # one sort by lower edge, then with a running max of the upper edges the
+    # entries overlapping an earlier one are found in one vectorized pass and
+    # their partners by binary search, so only overlapping pairs are visited
+    # in python. Touching within rtol of the stack extent is not an overlap
+    findings = []
+    if not stack:
+        return findings
+    names = list(stack.keys())
+    lDatas = list(stack.values())
+    types = np.array([layer_codes[lData.type] for lData in lDatas])
+    z0 = np.array([lData.z0 for lData in lDatas], dtype=float)
+    z1 = np.array([lData.z1 for lData in lDatas], dtype=float)
+    h = np.array([lData.height for lData in lDatas], dtype=float)
+    lo, hi = np.minimum(z0, z1), np.maximum(z0, z1)
+    tol = rtol*np.max(hi-np.minimum(lo, 0))
+
+    for i in np.flatnonzero((z1<z0-tol)|(h<-tol)):
+        findings.append(Finding("negHeight", (names[i],), z0[i], z1[i]))
+    for i in np.flatnonzero(types==2):
+        for cName in lDatas[i].connects or ():
+            if cName not in stack:
+                findings.append(Finding("danglingVia", (names[i], cName), z0[i], z1[i]))
+
+    # dielectrics: compare each lower edge with the highest top below it
+    d = np.flatnonzero(types==0)
+    d = d[np.lexsort((hi[d], lo[d]))]
+    if len(d)>1:
+        top = np.maximum.accumulate(hi[d])
+        topPos = np.maximum.accumulate(np.where(hi[d]>=top, np.arange(len(d)), 0))
+        for k in np.flatnonzero((lo[d][1:]>top[:-1]+tol)|(lo[d][1:]<top[:-1]-tol))+1:
+            prev, cur = d[topPos[k-1]], d[k]
+            if lo[cur]>top[k-1]:
+                findings.append(Finding("dielGap", (names[prev], names[cur]), top[k-1], lo[cur]))
+            else:
+                findings.append(Finding("dielOverlap", (names[prev], names[cur]), lo[cur], min(hi[cur], top[k-1])))
+
+    # conductors and vias of non-zero height
+    c = np.flatnonzero((types!=0)&(hi-lo>tol))
+    c = c[np.argsort(lo[c], kind="stable")]
+    cLo, cHi = lo[c], hi[c]
+    maxHi = np.maximum.accumulate(cHi) if len(c) else cHi
+    flagged = np.flatnonzero(np.concatenate(([False], maxHi[:-1]>cLo[1:]+tol)))
+    starts = np.searchsorted(maxHi, cLo[flagged]+tol, side="right")
+    cHiArr = cHi
+    c, cLo, cHi, lo, hi, types = (c.tolist(), cLo.tolist(), cHi.tolist(), lo.tolist(), hi.tolist(), types.tolist())
+    for k,start in zip(flagged.tolist(), starts.tolist()):
+        # short candidate slices are cheaper to scan as lists
+        if k-start>64:
+            js = (start+np.flatnonzero(cHiArr[start:k]>cLo[k]+tol)).tolist()
+        else:
+            js = [j for j in range(start, k) if cHi[j]>cLo[k]+tol]
+        for j in js:
+            first, second = c[j], c[k]
+            zRange = (lo[second], min(hi[first], hi[second]))
+            if types[first]==1 and types[second]==1:
+                findings.append(Finding("condOverlap", (names[first], names[second]), *zRange))
+            elif types[first]!=types[second]:
+                vIdx, cIdx = (first, second) if types[first]==2 else (second, first)
+                if names[cIdx] not in (lDatas[vIdx].connects or ()):
+                    findings.append(Finding("viaCross", (names[vIdx], names[cIdx]), *zRange))
+    return findings
+
+# Define Permittivity Profile ##################################################
+class PermittivityProfile():
+    # C(z) = integral of dz/eps over the dielectrics, piecewise linear between
+    # layer boundaries, so the series permittivity of [z0, z1] is
+    # (z1-z0)/(C(z1)-C(z0)) for any z0/z1, including partial layers
+    def __init__(self, stack, materials):
+        lDatas = sorted((lData for lData in stack.values() if lData.type=="dielectric"), key=lambda lData: lData.z0)
+        self.z0 = np.array([lData.z0 for lData in lDatas], dtype=float)
+        self.z1 = np.array([lData.z1 for lData in lDatas], dtype=float)
+        self.eps = np.array([materials[lData.material].constant for lData in lDatas], dtype=float)
+        cum = np.concatenate(([0.0], np.cumsum((self.z1-self.z0)/self.eps)))
+        self.zp = np.column_stack((self.z0, self.z1)).ravel()
+        self.cp = np.column_stack((cum[:-1], cum[1:])).ravel()
+
+    def cumulative(self, z):
+        z = np.asarray(z, dtype=float)
+        if not len(self.zp):
+            return np.full(z.shape, np.nan)[()]
+        ret = np.interp(z, self.zp, self.cp)
+        return np.where((z<self.zp[0])|(self.zp[-1]<z), np.nan, ret)[()]
+
+    def permittivityAt(self, z):
+        z = np.asarray(z, dtype=float)
+        if not len(self.eps):
+            return np.full(z.shape, np.nan)[()]
+        idx = np.clip(np.searchsorted(self.z0, z, side="right")-1, 0, len(self.z0)-1)
+        return np.where((z<self.z0[idx])|(self.z1[idx]<z), np.nan, self.eps[idx])[()]
+
+    def effective(self, z0, z1):
+        z0 = np.asarray(z0, dtype=float)
+        z1 = np.asarray(z1, dtype=float)
+        dz = z1-z0
+        dc = self.cumulative(z1)-self.cumulative(z0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret = dz/dc
+        return np.where(dz==0, self.permittivityAt(z0), ret)[()]
+
+# Define Layer Stack ###########################################################
+class TrackedDict(dict):
+    # dict counting its mutations, so what is built from it (indexes,
+    # profiles) can tell it is stale after stack[lName] = lData.replace(...)
+    __slots__ = ("version",)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, val):
+        dict.__setitem__(self, key, val)
+        self.version += 1
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def __ior__(self, other):
+        dict.update(self, other)
+        self.version += 1
+        return self
+
+    def __reduce__(self):
+        return (TrackedDict, (dict(self),))
+
+    def pop(self, *args):
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version += 1
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
+class LayerStack():
+    # stack and materials are held as TrackedDicts, a plain dict assigned to
+    # either is copied into one
+    __slots__ = ("stackDict","matDict","num","unit","indexCache")
+
+    def __init__(self, stack=None, materials=None, num=None, unit=None):
+        self.stack = stack if stack is not None else {}
+        self.materials = materials if materials is not None else {}
+        self.num = num if num is not None else {"layer":0, "conductor":0, "via":0}
+        self.unit = unit if unit is not None else {"length":None, "conductivity":None}
+        self.indexCache = {}
+
+    @property
+    def stack(self):
+        return self.stackDict
+
+    @stack.setter
+    def stack(self, stack):
+        self.stackDict = stack if type(stack) is TrackedDict else TrackedDict(stack)
+
+    @property
+    def materials(self):
+        return self.matDict
+
+    @materials.setter
+    def materials(self, materials):
+        self.matDict = materials if type(materials) is TrackedDict else TrackedDict(materials)
+
+    def getIndex(self, types=None):
+        # rebuilt when the stack dict is replaced or any entry is added,
+        # removed or reassigned
+        key = tuple(types) if types is not None else None
+        cached = self.indexCache.get(key)
+        if cached is None or cached[0] is not self.stack or cached[1]!=self.stack.version:
+            cached = (self.stack, self.stack.version, IntervalIndex.fromStack(self.stack, types))
+            self.indexCache[key] = cached
+        return cached[2]
+
+    def validate(self, rtol=1e-9):
+        return validateStack(self.stack, rtol)
+
+    def getPermittivityProfile(self):
+        # rebuilt like getIndex, on any change to the stack or materials dict
+        stack, materials = (self.stack, self.materials)
+        cached = self.indexCache.get("permittivity")
+        if cached is None or cached[0] is not stack or cached[1]!=stack.version or cached[2] is not materials or cached[3]!=materials.version:
+            cached = (stack, stack.version, materials, materials.version, PermittivityProfile(stack, materials))
+            self.indexCache["permittivity"] = cached
+        return cached[4]
+
+    def keys(self):
+        return ["stack","materials","num","unit"]
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, val):
+        if key not in self.keys():
+            raise KeyError(key)
+        setattr(self, key, val)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def copy(self):
+        # new containers around the same (shared) records
+        return LayerStack(TrackedDict(self.stack), TrackedDict(self.materials), dict(self.num), dict(self.unit))
+
+    def toDict(self):
+        return {
+            "stack":{lName:lData.toDict() for lName,lData in self.stack.items()},
+            "materials":{mName:mData.toDict() for mName,mData in self.materials.items()},
+            "num":dict(self.num),
+            "unit":dict(self.unit)}
+
+    def toArrays(self):
+        # names plus one structured array per table; offset/origin of
+        # dielectrics are stored as nan
+        matNames = list(self.materials.keys())
+        matIdx = {mName:i for i,mName in enumerate(matNames)}
+        layerIdx = {lName:i for i,lName in enumerate(self.stack.keys())}
+        stackArr = np.empty(len(self.stack), dtype=stack_dtype)
+        for i,lData in enumerate(self.stack.values()):
+            connects = lData.connects if lData.connects else (None, None)
+            stackArr[i] = (
+                layer_types.index(lData.type), matIdx.get(lData.material, -1), lData.height, lData.z0, lData.z1,
+                np.nan if lData.offset is None else lData.offset,
+                np.nan if lData.origin is None else lData.origin,
+                layerIdx.get(connects[0], -1), layerIdx.get(connects[1], -1))
+        matArr = np.empty(len(matNames), dtype=material_dtype)
+        for i,mData in enumerate(self.materials.values()):
+            matArr[i] = (material_types.index(mData.type), mData.constant, mData.conductivity, mData.height, mData.tandel, mData.tcr, mData.tcr2, mData.tempRef, mData.freqRef)
+        return list(self.stack.keys()), stackArr, matNames, matArr
+
+    def toColumns(self):
+        # export_columns as one contiguous float64 array per numeric column
+        # (nan where an entry or its material has no value) and lists for the
+        # string columns
+        num = len(self.stack)
+        lDatas = list(self.stack.values())
+        mDatas = [self.materials.get(lData.material) for lData in lDatas]
+        def column(vals):
+            return np.fromiter((np.nan if val is None else val for val in vals), dtype=float, count=num)
+        return {
+            "name":list(self.stack.keys()),
+            "type":[lData.type for lData in lDatas],
+            "material":[lData.material for lData in lDatas],
+            "z0":column(lData.z0 for lData in lDatas),
+            "z1":column(lData.z1 for lData in lDatas),
+            "height":column(lData.height for lData in lDatas),
+            "offset":column(lData.offset for lData in lDatas),
+            "origin":column(lData.origin for lData in lDatas),
+            "eps":column(None if mData is None else mData.constant for mData in mDatas),
+            "sigma":column(None if mData is None else mData.conductivity for mData in mDatas),
+            "tandel":column(None if mData is None else mData.tandel for mData in mDatas)}
+
+    @classmethod
+    def fromArrays(cls, layerNames, stackArr, matNames, matArr, num=None, unit=None):
+        stack = {}
+        for lName,row in zip(layerNames, stackArr.tolist()):
+            lType, mIdx, h, z0, z1, offset, origin, btmIdx, topIdx = row
+            lType = layer_types[lType]
+            if lType=="dielectric":
+                offset, origin = (None, None)
+            connects = (layerNames[btmIdx], layerNames[topIdx]) if btmIdx>=0 and topIdx>=0 else None
+            stack[lName] = StackLayer(lType, matNames[mIdx] if mIdx>=0 else None, h, z0, z1, offset, origin, connects)
+        materials = {}
+        for mName,row in zip(matNames, matArr.tolist()):
+            materials[mName] = Material(material_types[row[0]], *row[1:])
+        return cls(stack, materials, num, unit)
+
+    @classmethod
+    def fromDict(cls, layerData):
+        if isinstance(layerData, LayerStack):
+            return layerData
+        return cls(
+            {lName:StackLayer.fromDict(lData) for lName,lData in layerData["stack"].items()},
+            {mName:Material.fromDict(mData) for mName,mData in layerData["materials"].items()},
+            dict(layerData["num"]),
+            dict(layerData["unit"]))
+
+    def __repr__(self):
+        return f"LayerStack({len(self.stack)} layers, {len(self.materials)} materials)"
@@ -0,0 +1,74 @@
+from collections import namedtuple
+import numpy as np
+
+# Define Model Defaults ########################################################
+# reference temperature (K) of a tcr given without -tr, and the band (Hz) the
+# wideband Debye (Djordjevic-Sarkar) model of a dispersive dielectric spans
+def_temp_ref = 293.15
+def_freq_low = 1.0e3
+def_freq_high = 1.0e12
+
+# sigma/eps/tandel of shape (materials, temperature, frequency)
+MaterialGrid = namedtuple("MaterialGrid", ["names","temperature","frequency","sigma","eps","tandel"])
+
+def getParams(materials, names):
+    # one float column per Material slot over names
+    mDatas = [materials[mName] for mName in names]
+    def column(attr):
+        return np.fromiter((getattr(mData, attr) for mData in mDatas), dtype=float, count=len(mDatas))
+    params = {attr:column(attr) for attr in ["constant","conductivity","height","tandel","tcr","tcr2","tempRef","freqRef"]}
+    params["tempRef"][np.isnan(params["tempRef"])] = def_temp_ref
+    return params
+
+def tcrFactor(tcr, tcr2, tempRef, temperature):
+    # resistivity ratio rho(T)/rho(tempRef) = 1+tcr*dT+tcr2*dT**2, shape (M, T)
+    dT = temperature[None,:]-tempRef[:,None]
+    return 1.0+dT*(tcr[:,None]+dT*tcr2[:,None])
+
+def dsResponse(frequency, fLow=def_freq_low, fHigh=def_freq_high):
+    # log10((f2+jf)/(f1+jf))/log10(f2/f1), the normalized Djordjevic-Sarkar
+    # term; eps(f) = epsInf+dEps*dsResponse(f) with eps = eps'-j*eps''
+    frequency = np.asarray(frequency, dtype=float)
+    return np.log10((fHigh+1j*frequency)/(fLow+1j*frequency))/np.log10(fHigh/fLow)
+
+def dsParams(eps, tandel, freqRef, fLow=def_freq_low, fHigh=def_freq_high):
+    # (epsInf, dEps) matching eps'/tandel at freqRef; materials without a
+    # reference frequency (or eps/tandel) are kept frequency independent,
+    # dEps 0 and nan for them
+    dispersive = np.isfinite(freqRef)&np.isfinite(eps)&np.isfinite(tandel)
+    resp = dsResponse(np.where(dispersive, freqRef, fLow), fLow, fHigh)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dEps = np.where(dispersive, -eps*tandel/resp.imag, 0.0)
+    epsInf = np.where(dispersive, eps-dEps*resp.real, eps)
+    return epsInf, dEps, dispersive
+
+def evalMaterials(materials, temperature, frequency, names=None, toSI=None, fromSI=None, fLow=def_freq_low, fHigh=def_freq_high):
+    # materials {name:Material} on the temperature (K) x frequency (Hz) grid.
+    # toSI(height, val)/fromSI(height, val) convert stored conductivities to
+    # S/m and the result back, both for arrays of materials; None keeps S/m.
+    # Every slow step runs on (M, T) or (M, F), the full grid is only filled
+    names = list(materials.keys()) if names is None else list(names)
+    temperature = np.atleast_1d(np.asarray(temperature, dtype=float))
+    frequency = np.atleast_1d(np.asarray(frequency, dtype=float))
+    params = getParams(materials, names)
+    shape = (len(names), len(temperature), len(frequency))
+
+    height = params["height"]
+    sigma0 = toSI(height, params["conductivity"]) if toSI is not None else params["conductivity"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigmaT = sigma0[:,None]/tcrFactor(params["tcr"], params["tcr2"], params["tempRef"], temperature)
+        if fromSI is not None:
+            sigmaT = fromSI(height[:,None], sigmaT)
+    sigma = np.empty(shape)
+    sigma[...] = sigmaT[:,:,None]
+
+    epsInf, dEps, dispersive = dsParams(params["constant"], params["tandel"], params["freqRef"], fLow, fHigh)
+    resp = dsResponse(frequency, fLow, fHigh)
+    epsF = epsInf[:,None]+dEps[:,None]*resp.real[None,:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tandelF = np.where(dispersive[:,None], -dEps[:,None]*resp.imag[None,:]/epsF, params["tandel"][:,None])
+    eps = np.empty(shape)
+    eps[...] = epsF[:,None,:]
+    tandel = np.empty(shape)
+    tandel[...] = tandelF[:,None,:]
+    return MaterialGrid(names, temperature, frequency, sigma, eps, tandel)
@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import math
+import asyncio
+import inspect
+import argparse
+from collections import namedtuple
+from . import units
+from . import layermap
+
+# Define Store #################################################################
+# a parsed layermap with the indexes every query needs built up front; never
+# modified after construction, a reload replaces the whole entry
+StoreEntry = namedtuple("StoreEntry", ["fileName","mtime","matPrefix","layerData","index","profile","diagnostics"])
+
+def loadEntry(fileName, matPrefix='T65_', defLen="m", defCond="S/m"):
+    stat = os.stat(fileName)
+    lme = layermap.LayerMapEditor(None, defLen=defLen, defCond=defCond, validate=False)
+    diagnostics = lme.importFile(fileName, matPrefix=matPrefix, verbose=False)
+    layerData = lme.layerData
+    return StoreEntry(fileName, (stat.st_mtime_ns, stat.st_size), matPrefix, layerData,
+        layerData.getIndex(), layerData.getPermittivityProfile(), [str(diag) for diag in diagnostics])
+
+class StackStore():
+    # key -> StoreEntry. Readers take the current entry with one dict lookup
+    # and use it without locks; loads and reloads parse off the event loop and
+    # then swap the reference
+    def __init__(self, defLen="m", defCond="S/m"):
+        self.entries = {}
+        self.defLen = defLen
+        self.defCond = defCond
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            raise serviceError("unDefKey", key)
+        return entry
+
+    async def load(self, key, fileName, matPrefix='T65_'):
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, loadEntry, os.path.abspath(fileName), matPrefix, self.defLen, self.defCond)
+        self.entries[key] = entry
+        return entry
+
+    def unload(self, key):
+        self.get(key)
+        del self.entries[key]
+
+    async def refresh(self):
+        # reload the entries whose file changed on disk; returns their keys
+        reloaded = []
+        for key,entry in list(self.entries.items()):
+            try:
+                stat = os.stat(entry.fileName)
+            except OSError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size)!=entry.mtime and self.entries.get(key) is entry:
+                await self.load(key, entry.fileName, entry.matPrefix)
+                reloaded.append(key)
+        return reloaded
+
+    async def watch(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+# Define Queries ###############################################################
+def layerInfo(entry, lName):
+    stack = entry.layerData.stack
+    if lName not in stack:
+        raise serviceError("unDefLayerName", lName)
+    lData = stack[lName]
+    mData = entry.layerData.materials.get(lData.material)
+    return {"name":lName, **lData.toDict(), "materialData":mData.toDict() if mData is not None else None}
+
+class StackService():
+    # JSON-RPC 2.0, one request or response object per line, over a unix
+    # socket (path) or localhost tcp (port). Heights are in each stack's own
+    # length unit, as parsed
+    def __init__(self, store=None, path=None, host="127.0.0.1", port=0, watchInterval=1.0):
+        self.store = store if store is not None else StackStore()
+        self.path = path
+        self.host = host
+        self.port = port
+        self.watchInterval = watchInterval
+        self.um = units.UnitManager()
+        self.server = None
+        self.watcher = None
+        self.methods = {
+            "load":self.rpcLoad,
+            "unload":self.rpcUnload,
+            "keys":self.rpcKeys,
+            "layer":self.rpcLayer,
+            "layers":self.rpcLayers,
+            "overlaps":self.rpcOverlaps,
+            "convert":self.rpcConvert,
+            "effPermittivity":self.rpcEffPermittivity}
+        self.signatures = {name:inspect.signature(func) for name,func in self.methods.items()}
+
+    async def rpcLoad(self, key, fileName, matPrefix='T65_'):
+        entry = await self.store.load(key, fileName, matPrefix)
+        return {"key":key, "layers":len(entry.layerData.stack), "diagnostics":entry.diagnostics}
+
+    async def rpcUnload(self, key):
+        self.store.unload(key)
+        return True
+
+    def rpcKeys(self):
+        return {key:entry.fileName for key,entry in self.store.entries.items()}
+
+    def rpcLayer(self, key, name):
+        return layerInfo(self.store.get(key), name)
+
+    def rpcLayers(self, key, types=None):
+        stack = self.store.get(key).layerData.stack
+        return [lName for lName,lData in stack.items() if types is None or lData.type in types]
+
+    def rpcOverlaps(self, key, z0, z1, types=None):
+        entry = self.store.get(key)
+        names = entry.index.overlaps(z0, z1)
+        if types is not None:
+            stack = entry.layerData.stack
+            names = [lName for lName in names if stack[lName].type in types]
+        return names
+
+    def rpcConvert(self, val, unit1, unit2):
+        for unit in (unit1, unit2):
+            if not self.um.isValid(unit):
+                raise serviceError("inValidUnitName", unit)
+        return self.um.convUnit(val=val, unit1=unit1, unit2=unit2)
+
+    def rpcEffPermittivity(self, key, z0, z1):
+        ret = self.store.get(key).profile.effective(z0, z1)
+        return ret.tolist() if hasattr(ret, "tolist") else ret
+
+    async def dispatch(self, req):
+        reqId = req.get("id") if isinstance(req, dict) else None
+        try:
+            if not isinstance(req, dict) or not isinstance(req.get("method"), str):
+                return rpcError(reqId, -32600, "Invalid Request")
+            func = self.methods.get(req["method"])
+            if func is None:
+                return rpcError(reqId, -32601, f'Method not found: {req["method"]}')
+            params = req.get("params", {})
+            if not isinstance(params, (list, dict)):
+                return rpcError(reqId, -32602, "Invalid params: not an array or object")
+            args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
+            try:
+                ret = func(*args, **kwargs)
+            except TypeError as e:
+                # only a failure to bind is the caller's fault, a TypeError raised
+                # inside the method is a server error; arguments are bound before
+                # the body runs, so checking after the fact keeps it off the hot path
+                sig = self.signatures.get(req["method"])
+                try:
+                    (sig if sig is not None else inspect.signature(func)).bind(*args, **kwargs)
+                except TypeError as bindErr:
+                    return rpcError(reqId, -32602, f"Invalid params: {bindErr}")
+                raise
+            if asyncio.iscoroutine(ret):
+                ret = await ret
+        except serviceError as e:
+            return rpcError(reqId, -32000, service_msgs[e.args[0]].format(*e.args), {"code":e.args[0], "args":toJSON(list(e.args[1:]))})
+        except Exception as e:
+            return rpcError(reqId, -32603, f"{type(e).__name__}: {e}")
+        return {"jsonrpc":"2.0", "id":reqId, "result":toJSON(ret)}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                except ValueError:
+                    resp = rpcError(None, -32700, "Parse error")
+                else:
+                    resp = await self.dispatch(req)
+                writer.write(json.dumps(resp, allow_nan=False).encode()+b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.server = await asyncio.start_unix_server(self.handle, path=self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host=self.host, port=self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        if self.watchInterval:
+            self.watcher = asyncio.ensure_future(self.store.watch(self.watchInterval))
+        return self
+
+    async def close(self):
+        if self.watcher is not None:
+            self.watcher.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def serveForever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+def toJSON(val):
+    # nan/inf (values a dielectric has no conductivity/tandel for) as null,
+    # json.dumps would write them as bare NaN/Infinity, which is not JSON
+    if isinstance(val, float):
+        return val if math.isfinite(val) else None
+    if isinstance(val, dict):
+        return {key:toJSON(v) for key,v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [toJSON(v) for v in val]
+    return val
+
+def rpcError(reqId, code, message, data=None):
+    err = {"code":code, "message":message}
+    if data is not None:
+        err["data"] = data
+    return {"jsonrpc":"2.0", "id":reqId, "error":err}
+
+# Define Client ################################################################
+class StackClient():
+    # one connection; requests on it are answered in order
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.nextId = 0
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def call(self, method, **params):
+        self.nextId += 1
+        self.writer.write(json.dumps({"jsonrpc":"2.0", "id":self.nextId, "method":method, "params":toJSON(params)}, allow_nan=False).encode()+b"\n")
+        await self.writer.drain()
+        resp = json.loads(await self.reader.readline())
+        if "error" in resp:
+            raise serviceError("rpcError", resp["error"]["message"], resp["error"].get("data"))
+        return resp["result"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+class serviceError(Exception):
+    pass
+
+service_msgs = {
+    "unDefKey"          :'No layermap loaded as "{1}".',
+    "unDefLayerName"    :'Undefined layer name "{1}".',
+    "inValidUnitName"   :'Invalid unit name "{1}".',
+    "rpcError"          :'{1}'
+}
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description="layermap query service")
+    parser.add_argument("--socket", help="unix socket path (default: localhost tcp)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--watch", type=float, default=1.0, help="seconds between file change checks, 0 to disable")
+    parser.add_argument("--load", nargs=2, action="append", metavar=("KEY","FILE"), default=[])
+    args = parser.parse_args()
+
+    async def main():
+        service = StackService(path=args.socket, port=args.port, watchInterval=args.watch)
+        for key,fileName in args.load:
+            await service.store.load(key, fileName)
+        await service.start()
+        print(f"listening on {args.socket or f'127.0.0.1:{service.port}'}", file=sys.stderr, flush=True)
+        async with service.server:
+            await service.server.serve_forever()
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+import numpy as np
+from . import layerstack
+
+# Define Sweep Parameters ######################################################
+# parameters that can vary per entry type; "height" of a conductor is its
+# drawn thickness without bias, "offset" its offset before bias
+sweep_params = {
+    "dielectric":["height","constant"],
+    "conductor":["height","bias","offset","conductivity"],
+    "via":["conductivity"]
+}
+
+class StackSweep():
+    # base parameters of a parsed stack as (L,) arrays in stack order, from
+    # which any number of variants is evaluated as (N, L) arrays
+    def __init__(self, layerData):
+        self.layerData = layerData
+        stack = layerData.stack
+        materials = layerData.materials
+        self.names = list(stack.keys())
+        self.types = np.array([lData.type for lData in stack.values()])
+        nameIdx = {lName:i for i,lName in enumerate(self.names)}
+        num = len(self.names)
+
+        self.base = {param:np.full(num, np.nan) for param in ["height","bias","offset","constant","conductivity"]}
+        self.z0 = np.array([lData.z0 for lData in stack.values()], dtype=float)
+        self.z1 = np.array([lData.z1 for lData in stack.values()], dtype=float)
+        self.origin = np.full(num, np.nan)
+        for i,lData in enumerate(stack.values()):
+            mData = materials[lData.material]
+            self.base["conductivity"][i] = mData.conductivity
+            if lData.type=="dielectric":
+                self.base["height"][i] = lData.height
+                self.base["constant"][i] = mData.constant
+            elif lData.type=="conductor":
+                bias = lData.height-mData.height
+                self.base["height"][i] = mData.height
+                self.base["bias"][i] = bias
+                self.base["offset"][i] = lData.offset+bias/2
+                self.origin[i] = lData.origin
+        self.base["bias"][self.types!="conductor"] = 0.0
+
+        # dielectrics sorted by z0; a conductor's origin moves with the
+        # dielectric boundary at or below it
+        self.dielIdx = np.flatnonzero(self.types=="dielectric")
+        self.dielIdx = self.dielIdx[np.argsort(self.z0[self.dielIdx], kind="stable")]
+        self.condIdx = np.flatnonzero(self.types=="conductor")
+        self.originBnd = np.searchsorted(self.z0[self.dielIdx], self.origin[self.condIdx], side="right")
+        self.viaIdx = np.flatnonzero(self.types=="via")
+        self.viaEnds = np.array([[nameIdx.get(end, -1) for end in (stack[self.names[i]].connects or (None,None))] for i in self.viaIdx], dtype=int).reshape(-1,2)
+
+    def getParamIdx(self, lName, param):
+        i = self.names.index(lName)
+        if param not in sweep_params[self.types[i]]:
+            raise sweepError("unDefParam", lName, param)
+        return i
+
+    def tileBase(self, n):
+        return {param:np.repeat(base[np.newaxis,:], n, axis=0) for param,base in self.base.items()}
+
+    def genMonteCarlo(self, n, specs, seed=None, relative=False):
+        # specs: {layerName:{param:spec}}, spec is a normal sigma added to the
+        # base value (a fraction of it if relative) or a callable
+        # f(rng, n) returning n absolute samples
+        rng = np.random.default_rng(seed)
+        params = self.tileBase(n)
+        for lName,lSpecs in specs.items():
+            for param,spec in lSpecs.items():
+                i = self.getParamIdx(lName, param)
+                if callable(spec):
+                    params[param][:,i] = spec(rng, n)
+                else:
+                    sigma = spec*abs(self.base[param][i]) if relative else spec
+                    params[param][:,i] += rng.normal(0.0, sigma, n)
+        return StackVariants(self, params)
+
+    def genCorners(self, corners):
+        # corners: {cornerName:{layerName:{param:value}}} with absolute values
+        names = list(corners.keys())
+        params = self.tileBase(len(names))
+        for k,cName in enumerate(names):
+            for lName,lVals in corners[cName].items():
+                for param,val in lVals.items():
+                    params[param][k,self.getParamIdx(lName, param)] = val
+        return StackVariants(self, params, names)
+
+class StackVariants():
+    def __init__(self, sweep, params, names=None):
+        self.sweep = sweep
+        self.params = params
+        self.names = names
+        self.ranges = None
+
+    def __len__(self):
+        return self.params["height"].shape[0]
+
+    def calcRanges(self):
+        # (N, L) arrays of z0, z1, plotted height, offset and origin for all variants
+        if self.ranges is not None:
+            return self.ranges
+        sw = self.sweep
+        n = len(self)
+        h = self.params["height"]
+        bias = self.params["bias"]
+        offset = self.params["offset"]
+        z0 = np.repeat(sw.z0[np.newaxis,:], n, axis=0)
+        z1 = np.repeat(sw.z1[np.newaxis,:], n, axis=0)
+        height = h.copy()
+        outOffset = np.full(z0.shape, np.nan)
+        outOrigin = np.full(z0.shape, np.nan)
+
+        # dielectrics move up by the thickness change of everything below
+        dIdx = sw.dielIdx
+        shift = np.concatenate((np.zeros((n,1)), np.cumsum(h[:,dIdx]-sw.base["height"][dIdx], axis=1)), axis=1)
+        z0[:,dIdx] = sw.z0[dIdx]+shift[:,:-1]
+        z1[:,dIdx] = z0[:,dIdx]+h[:,dIdx]
+
+        cIdx = sw.condIdx
+        origin = sw.origin[cIdx]+shift[:,np.maximum(sw.originBnd,1)-1]*(sw.originBnd>0)
+        z0[:,cIdx] = origin+offset[:,cIdx]-bias[:,cIdx]/2
+        z1[:,cIdx] = origin+offset[:,cIdx]+h[:,cIdx]+bias[:,cIdx]/2
+        height[:,cIdx] = h[:,cIdx]+bias[:,cIdx]
+        outOffset[:,cIdx] = offset[:,cIdx]-bias[:,cIdx]/2
+        outOrigin[:,cIdx] = origin
+
+        # vias in stack order, so a via may sit on an earlier via
+        for i,(btm,top) in zip(sw.viaIdx, sw.viaEnds):
+            if btm<0 or top<0:
+                continue
+            up = z1[:,btm]<=z0[:,top]
+            z0[:,i] = np.where(up, z1[:,btm], z1[:,top])
+            z1[:,i] = np.where(up, z0[:,top], z0[:,btm])
+            height[:,i] = z1[:,i]-z0[:,i]
+            outOffset[:,i] = np.where(up, outOffset[:,btm], outOffset[:,top])
+            outOrigin[:,i] = np.where(up, outOrigin[:,btm], outOrigin[:,top])
+        self.ranges = {"z0":z0, "z1":z1, "height":height, "offset":outOffset, "origin":outOrigin}
+        return self.ranges
+
+    def getVariant(self, k):
+        # materialize one variant as a LayerStack, sharing unchanged materials
+        sw = self.sweep
+        ranges = self.calcRanges()
+        stack = {}
+        materials = dict(sw.layerData.materials)
+        for i,(lName,lData) in enumerate(sw.layerData.stack.items()):
+            isDiel = lData.type=="dielectric"
+            stack[lName] = lData.replace(
+                height=float(ranges["height"][k,i]), z0=float(ranges["z0"][k,i]), z1=float(ranges["z1"][k,i]),
+                offset=None if isDiel else float(ranges["offset"][k,i]),
+                origin=None if isDiel else float(ranges["origin"][k,i]))
+            mData = materials[lData.material]
+            mHeight = self.params["height"][k,i] if lData.type!="via" else ranges["height"][k,i]
+            materials[lData.material] = mData.replace(
+                height=float(mHeight),
+                conductivity=float(self.params["conductivity"][k,i]),
+                constant=float(self.params["constant"][k,i]) if isDiel else mData.constant)
+        return layerstack.LayerStack(stack, materials, dict(sw.layerData.num), dict(sw.layerData.unit))
+
+    def __getitem__(self, k):
+        if self.names is not None and not isinstance(k, (int, np.integer)):
+            k = self.names.index(k)
+        return self.getVariant(k)
+
+class sweepError(Exception):
+    pass
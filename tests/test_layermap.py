@@ -0,0 +1,152 @@
+import pytest
+from package import layermap
+
+def importText(tmp_path, text, name="stack.txt", **kwargs):
+    fileName = tmp_path/name
+    fileName.write_text(text)
+    lme = layermap.LayerMapEditor(None, **kwargs)
+    diagnostics = lme.importFile(str(fileName), verbose=False)
+    return lme, diagnostics
+
+def test_numericNames(tmp_path):
+    # numbers where a name belongs are kept as written, not crashed on
+    lme, diagnostics = importText(tmp_path, "assume length um\nlayer 1 0.5 4\nconductor M1 0.2 0.01 ohm/sq\nlayer 2 0.5 4\nconductor 5.0 0.2 0.01 ohm/sq\nvia 7 M1 5.0 1e7\n")
+    assert diagnostics==[]
+    assert list(lme.layerData.stack)==["1", "M1", "2", "5.0", "7"]
+    assert lme.layerData.stack["7"].connects==("M1", "5.0")
+
+def test_numericNameErrors(tmp_path):
+    text = "assume length um\nconductor M1 0.2 0.01 ohm/sq\nvia V1 M1 9.0 1e7\nlayer 3 um 0.5 4\ninclude 5\n"
+    lme, diagnostics = importText(tmp_path, text)
+    assert [(diag.line, diag.code) for diag in diagnostics]==[(2, "unDefCondName"), (3, "inValidValue"), (4, "unDefFile")]
+    rows = text.splitlines()
+    for diag,tok in zip(diagnostics, ["9.0", "3", "5"]):
+        assert rows[diag.line][diag.column:].split()[0]==tok
+
+def test_floatArgColumn():
+    diag = layermap.Diagnostic.fromError(layermap.optError("unDefCondName", 5.0), 3, "via V1 M1 5.0 1e7")
+    assert diag.column==10
+
+def assertSameStack(layerData1, layerData2):
+    for attr in ["stack", "materials"]:
+        dict1, dict2 = (getattr(layerData1, attr), getattr(layerData2, attr))
+        assert list(dict1)==list(dict2)
+        for key,val in dict1.items():
+            assert val.isSame(dict2[key]), key
+
+def genStack(tmp_path, nLines, **kwargs):
+    from package import benchmark
+    fileName = tmp_path/"gen.txt"
+    benchmark.genLayermap(str(fileName), nLines, **kwargs)
+    return layermap.LayerMapEditor(str(fileName))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_mergeBatchEqualsSequential(tmp_path, seed):
+    import random
+    rng = random.Random(seed)
+    lme = genStack(tmp_path, 202)
+    nBlocks = lme.layerData.num["layer"]//2
+    # disjoint runs of IMD{i}..ILD{j} blocks
+    merges, i = ([], 0)
+    while i<nBlocks:
+        j = min(i+rng.randrange(3), nBlocks-1)
+        if rng.random()<0.5:
+            merges.append((f"IMD{i}", f"ILD{j}", f"D{i}_{j}"))
+        i = j+1
+    rng.shuffle(merges)
+    batch = lme.mergeLayersBatch(merges, overWrite=False)
+    layerData = lme.layerData
+    for merge in merges:
+        layerData = lme.mergeLayers(*merge, layerData=layerData, overWrite=False)
+    assertSameStack(batch, layerData)
+    assert lme.validateStack(batch)==[]
+
+def test_mergeBatchErrors(tmp_path):
+    lme = genStack(tmp_path, 42)
+    with pytest.raises(layermap.mergeError) as e:
+        lme.mergeLayersBatch([("IMD1", "ILD1", "D1"), ("IMD3", "ILD3", "D1")], overWrite=False)
+    assert e.value.args[:2]==("dupLayerName", "D1")
+    with pytest.raises(layermap.mergeError) as e:
+        lme.mergeLayersBatch([("IMD1", "ILD1", "IMD5")], overWrite=False)
+    assert e.value.args[:2]==("dupLayerName", "IMD5")
+    with pytest.raises(layermap.mergeError) as e:
+        lme.mergeLayersBatch([("IMD1", "ILD2", "D1"), ("IMD2", "ILD3", "D2")], overWrite=False)
+    assert e.value.args[0]=="overlapMerge"
+    # a new name may reuse one the batch consumes
+    merged = lme.mergeLayersBatch([("IMD1", "ILD1", "IMD1"), ("IMD2", "ILD2", "ILD2")], overWrite=False)
+    assert "IMD1" in merged.stack and "ILD2" in merged.stack and "ILD1" not in merged.stack
+
+def assertCloseStack(layerData1, layerData2, tol=1e-9):
+    # same names, order and values, floats within tol (cumulative heights
+    # shifted by reload() are not bit identical to a fresh parse)
+    for attr in ["stack", "materials"]:
+        dict1, dict2 = (getattr(layerData1, attr), getattr(layerData2, attr))
+        assert list(dict1)==list(dict2)
+        for key,rec in dict1.items():
+            for slot in type(rec).__slots__:
+                val1, val2 = (getattr(rec, slot), getattr(dict2[key], slot))
+                if type(val1) is float and type(val2) is float:
+                    assert val1==pytest.approx(val2, rel=tol, abs=tol, nan_ok=True), (key, slot)
+                else:
+                    assert val1==val2, (key, slot)
+    assert layerData1.num==layerData2.num
+
+def editRows(rng, rows, i):
+    # one random edit of a generated layermap below its assume lines
+    pos = rng.randrange(2, len(rows)+1)
+    op = rng.choice(["height", "height", "insert", "delete", "conductor"])
+    tokens = rows[min(pos, len(rows)-1)].split()
+    if op=="height" and tokens[0]=="layer":
+        tokens[2] = f"0.{rng.randrange(1, 10)}"
+        rows[min(pos, len(rows)-1)] = " ".join(tokens)
+    elif op=="conductor" and tokens[0]=="conductor":
+        tokens[2] = f"0.{rng.randrange(1, 3)}"
+        rows[min(pos, len(rows)-1)] = " ".join(tokens)
+    elif op=="delete" and pos<len(rows):
+        del rows[pos]
+    else:
+        rows.insert(pos, f"layer NEW{i} 0.{rng.randrange(1, 10)} 3.9")
+
+@pytest.mark.parametrize("seed", range(20))
+def test_reloadEqualsImport(tmp_path, seed):
+    import random
+    from package import benchmark
+    rng = random.Random(seed)
+    fileName = str(tmp_path/"edit.txt")
+    benchmark.genLayermap(fileName, 120, model=seed%2==1)
+    lme = layermap.LayerMapEditor(fileName)
+    with open(fileName) as f:
+        rows = f.read().splitlines()
+    incremental = 0
+    for i in range(15):
+        editRows(rng, rows, i)
+        with open(fileName, mode='w') as f:
+            f.write("\n".join(rows)+"\n")
+        report = lme.reload(verbose=False)
+        fresh = layermap.LayerMapEditor(None)
+        diagnostics = fresh.importFile(fileName, verbose=False)
+        assertCloseStack(lme.layerData, fresh.layerData)
+        assert lme.crHg==pytest.approx(fresh.crHg, rel=1e-9, abs=1e-9)
+        assert report.diagnostics==diagnostics
+        incremental += not report.full
+    assert incremental>=10
+
+def test_inheritContextFragment(tmp_path):
+    # the fragment's via only resolves against a conductor of the including file
+    (tmp_path/"frag.txt").write_text("layer D1 0.5 4\nconductor M2 0.2 0.01 ohm/sq\nvia V2 MA M2 1e7\nlayer D3 0.5 4\n")
+    head = "assume length um\nlayer D0 0.5 4\nconductor MA 0.2 0.01 ohm/sq\n"
+    lme, diagnostics = importText(tmp_path, head+"inherit frag.txt -u V2\n")
+    assert diagnostics==[]
+    assert list(lme.layerData.stack)==["D0", "MA", "D1", "M2"]
+    lme, diagnostics = importText(tmp_path, head+"inherit frag.txt -u D3\n")
+    assert diagnostics==[]
+    assert list(lme.layerData.stack)==["D0", "MA", "D1", "M2", "V2"]
+    assert lme.layerData.stack["V2"].connects==("MA", "M2")
+    lme, diagnostics = importText(tmp_path, head+"inherit frag.txt -u D9\ninclude 5\n")
+    assert [(diag.line, diag.code, diag.args[0]) for diag in diagnostics]==[(3, "unDefLayerName", "D9"), (4, "unDefFile", "5")]
+    assert layermap.LayerMapEditor(None).getFragment(str(tmp_path/"frag.txt"), "T65_").entries is None
+
+def test_temperatureUnits(tmp_path):
+    lme, diagnostics = importText(tmp_path, "assume length um\nlayer D1 0.5 4\nconductor M1 0.2 0.01 ohm/sq -tr 300 mK\nconductor M2 0.2 0.01 ohm/sq -tr 300 K\n")
+    assert [d.code for d in diagnostics]==["inValidValue"]
+    assert lme.layerData.materials["T65_M2"].tempRef==300.0
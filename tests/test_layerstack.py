@@ -0,0 +1,45 @@
+import pickle
+import pytest
+from package import layerstack
+
+def makeStack():
+    stack = {
+        "D1":layerstack.StackLayer("dielectric", "m_D1", 1.0, 0.0, 1.0),
+        "M1":layerstack.StackLayer("conductor", "m_M1", 0.5, 0.2, 0.7, 0.0, 0.0),
+        "D2":layerstack.StackLayer("dielectric", "m_D2", 2.0, 1.0, 3.0)}
+    materials = {
+        "m_D1":layerstack.Material("dielectric", constant=4.0, height=1.0),
+        "m_M1":layerstack.Material("conductor", conductivity=5e7, height=0.5),
+        "m_D2":layerstack.Material("dielectric", constant=2.0, height=2.0)}
+    return layerstack.LayerStack(stack, materials)
+
+def test_indexFollowsReassignment():
+    layerData = makeStack()
+    assert layerData.getIndex().overlaps(2.0, 2.5)==["D2"]
+    layerData.stack["M1"] = layerData.stack["M1"].replace(z0=2.1, z1=2.6)
+    assert sorted(layerData.getIndex().overlaps(2.0, 2.5))==["D2", "M1"]
+    del layerData.stack["D2"]
+    assert layerData.getIndex().overlaps(2.0, 2.5)==["M1"]
+
+def test_indexPerCopy():
+    layerData = makeStack()
+    copied = layerData.copy()
+    copied.stack["M1"] = copied.stack["M1"].replace(z0=2.1, z1=2.6)
+    assert layerData.getIndex().overlaps(2.0, 2.5)==["D2"]
+    assert sorted(copied.getIndex().overlaps(2.0, 2.5))==["D2", "M1"]
+
+def test_trackedDictPickles():
+    layerData = makeStack()
+    stack = pickle.loads(pickle.dumps(layerData.stack))
+    assert type(stack) is layerstack.TrackedDict and stack==layerData.stack
+
+def test_profileFollowsReassignment():
+    layerData = makeStack()
+    assert layerData.getPermittivityProfile().effective(1.0, 3.0)==pytest.approx(2.0)
+    materials = layerData.materials
+    materials["m_D2"] = materials["m_D2"].replace(constant=100.0)
+    assert layerData.getPermittivityProfile().effective(1.0, 3.0)==pytest.approx(100.0)
+    layerData.stack["D2"] = layerData.stack["D2"].replace(material="m_D1")
+    assert layerData.getPermittivityProfile().effective(1.0, 3.0)==pytest.approx(4.0)
+    layerData.materials = {**materials, "m_D1":materials["m_D1"].replace(constant=8.0)}
+    assert layerData.getPermittivityProfile().effective(1.0, 3.0)==pytest.approx(8.0)
@@ -0,0 +1,38 @@
+import json
+import asyncio
+from package import service
+
+def dispatch(svc, method, params):
+    return asyncio.run(svc.dispatch({"jsonrpc":"2.0", "id":1, "method":method, "params":params}))
+
+def loadService(tmp_path):
+    fileName = tmp_path/"stack.txt"
+    fileName.write_text("assume length um\nlayer D1 0.5 4\nconductor M1 0.2 0.01 ohm/sq\n")
+    svc = service.StackService(watchInterval=0)
+    assert "result" in dispatch(svc, "load", {"key":"s", "fileName":str(fileName)})
+    return svc
+
+def test_nanAsNull(tmp_path):
+    svc = loadService(tmp_path)
+    resp = dispatch(svc, "layer", {"key":"s", "name":"D1"})
+    assert resp["result"]["materialData"]["conductivity"] is None
+    assert resp["result"]["materialData"]["constant"]==4.0
+    assert resp["result"]["range"]==[0.0, 0.5]
+    # strict JSON, as written to the socket
+    json.loads(json.dumps(resp, allow_nan=False))
+    assert dispatch(svc, "effPermittivity", {"key":"s", "z0":5.0, "z1":6.0})["result"] is None
+
+def test_invalidParams(tmp_path):
+    svc = loadService(tmp_path)
+    assert dispatch(svc, "layer", {"key":"s"})["error"]["code"]==-32602
+    assert dispatch(svc, "layer", ["s", "D1", "extra"])["error"]["code"]==-32602
+    assert dispatch(svc, "layer", "s")["error"]["code"]==-32602
+    assert dispatch(svc, "layer", {"key":"s", "name":"D9"})["error"]["data"]["code"]=="unDefLayerName"
+
+def test_internalTypeError(tmp_path):
+    # a TypeError inside a method is a server error, not a params error
+    svc = loadService(tmp_path)
+    svc.methods["sum"] = lambda vals: sum(vals)
+    assert dispatch(svc, "sum", {"vals":[1, 2]})["result"]==3
+    resp = dispatch(svc, "sum", {"vals":[1, "2"]})
+    assert resp["error"]["code"]==-32603 and resp["error"]["message"].startswith("TypeError")
@@ -0,0 +1,57 @@
+import copy
+import pytest
+from package import units
+
+@pytest.fixture
+def unitTables():
+    # registration changes the process-wide tables, put them back afterwards
+    org = copy.deepcopy(units.available_units)
+    yield
+    units.available_units.clear()
+    units.available_units.update(org)
+    units.updateUnitTables()
+
+def test_registerScaledUnit(unitTables):
+    digest = units.UnitManager().getUnitDigest()
+    units.registerUnit("length", "mil", 2.54e-5)
+    um = units.UnitManager()
+    assert um.getDimName("mil")=="length"
+    assert um.getBaseUnit("mil")=="m"
+    assert "mil" in um.getUnitNames("length")
+    assert um.convUnit(1.0, "mil", "um")==pytest.approx(25.4)
+    assert um.convUnit(25.4, "um", "mil")==pytest.approx(1.0)
+    assert um.convUnit(um.convUnit(3.0, "mil", "nm"), "nm", "mil")==pytest.approx(3.0)
+    assert units.UnitManager().getUnitDigest()!=digest
+
+def test_registeredUnitsSurviveRebuild(unitTables):
+    units.registerUnit("length", "mil", 2.54e-5)
+    units.registerUnit("length", "Å", 1e-10)
+    units.registerPrefix("p", 1e-12)
+    um = units.UnitManager()
+    assert um.convUnit(1.0, "mil", "m")==pytest.approx(2.54e-5)
+    assert um.convUnit(1.0, "nm", "Å")==pytest.approx(10.0)
+    assert um.convUnit(1.0, "pm", "Å")==pytest.approx(0.01)
+    units.updateUnitTables()
+    assert um.isValid("mil") and um.isValid("Å")
+
+def test_registerUnitErrors(unitTables):
+    with pytest.raises(units.unitError):
+        units.registerUnit("length", "um", 1e-6)
+    with pytest.raises(units.unitError):
+        units.registerUnit("length", "Hz", 1.0)
+    with pytest.raises(units.unitError):
+        units.registerUnit("nodim", "x", 1.0)
+    with pytest.raises(units.unitError):
+        units.registerUnit("length", "m")
+    assert not units.UnitManager().isValid("x")
+
+def test_temperatureUnprefixed(unitTables):
+    # only K, a prefixed temperature (mK, MK, ...) is not a unit token
+    um = units.UnitManager()
+    assert um.getUnitNames("temperature")==["K"]
+    assert um.getBaseUnit("K")=="K"
+    assert not any(um.isValid(f"{pf}K") for pf in units.available_units['unit_prefix'] if pf)
+    units.registerUnit("temperature", "mK", 1e-3)
+    assert um.convUnit(300.0, "mK", "K")==pytest.approx(0.3)
+    with pytest.raises(units.unitError):
+        units.registerUnit("temperature", "K")
@@ -1,4 +1,5 @@
 import re
+from types import MappingProxyType
 import numpy as np
 
 # Define Units #################################################################
@@ -21,6 +22,11 @@ available_units = {
         'resistivity'   :'ohm*m',
         'sheet_resistance':'ohm/sq'
     },
+    # base unit only, no prefix expansion (a kK or MK token would only
+    # shadow number+suffix spellings); scale through custom_unit
+    'unprefixed_quantity':{
+        'temperature'   :'K'
+    },
     'special_quantity':{
         'area'          :['m2', 'm*m'],
         'volume'        :['m3', 'm*m*m']
@@ -35,29 +41,127 @@ available_units = {
         'u' :1.0e-6,
         'n' :1.0e-9,
         'f' :1.0e-12
-    }
+    },
+    # dim -> {uname:factor}, scaled units of a physical quantity in its base
+    # unit (mil = 2.54e-5 m), not prefixed
+    'custom_unit':{}
+}
+
+# Define Resistivity Conversions ###############################################
+resistivity_dims = ['resistivity', 'conductivity', 'sheet_resistance']
+trans_resistivity = {
+    ('resistivity','resistivity')           :lambda t,v,out: np.positive(v, out=out),
+    ('resistivity','conductivity')          :lambda t,v,out: np.divide(1.0, v, out=out),
+    ('resistivity','sheet_resistance')      :lambda t,v,out: np.divide(v, t, out=out),
+    ('conductivity','resistivity')          :lambda t,v,out: np.divide(1.0, v, out=out),
+    ('conductivity','conductivity')         :lambda t,v,out: np.positive(v, out=out),
+    ('conductivity','sheet_resistance')     :lambda t,v,out: np.divide(1.0, np.multiply(t, v, out=out), out=out),
+    ('sheet_resistance','resistivity')      :lambda t,v,out: np.multiply(t, v, out=out),
+    ('sheet_resistance','conductivity')     :lambda t,v,out: np.divide(1.0, np.multiply(t, v, out=out), out=out),
+    ('sheet_resistance','sheet_resistance') :lambda t,v,out: np.positive(v, out=out)
 }
+# the same conversions as exponents (a,b) of val**a * t**b
+resistivity_exps = {
+    ('resistivity','resistivity')           :(1,0),
+    ('resistivity','conductivity')          :(-1,0),
+    ('resistivity','sheet_resistance')      :(1,-1),
+    ('conductivity','resistivity')          :(-1,0),
+    ('conductivity','conductivity')         :(1,0),
+    ('conductivity','sheet_resistance')     :(-1,-1),
+    ('sheet_resistance','resistivity')      :(1,1),
+    ('sheet_resistance','conductivity')     :(-1,-1),
+    ('sheet_resistance','sheet_resistance') :(1,0)
+}
+
+# Generate Unit Tables #########################################################
+def genUnitTables(src):
+    # expand every physical quantity with every prefix, then index
+    # uname -> (dim, factor, base unit) so lookups are one hash probe
+    units = {}
+    for dim,pq in src['physical_quantity'].items():
+        units[dim] = {}
+        pq_arr = re.split(r'[/*]', pq)
+        pq_num = re.findall(r'\*(\w*)', pq)
+        pq_num.append(pq_arr[0])
+        for i,sub_pq in enumerate(pq_arr):
+            for pf, dg in src['unit_prefix'].items():
+                for j,tmp in enumerate(pq_arr):
+                    join_char = '*' if tmp in pq_num else '/'
+                    tmp = tmp if j!=i else f'{pf}{tmp}'
+                    vname = tmp if j==0 else vname+join_char+tmp
+                dg = dg if sub_pq in pq_num else 1/dg
+                units[dim][vname] = dg
+    for dim,pq in src.get('unprefixed_quantity', {}).items():
+        units[dim] = {pq:1.0}
+    bases = {**src['physical_quantity'], **src.get('unprefixed_quantity', {})}
+    for dim,dimUnits in src.get('custom_unit', {}).items():
+        for uname,dg in dimUnits.items():
+            if uname in units[dim]:
+                raise unitError("dupUnitName", uname, dim, dim)
+            units[dim][uname] = dg
+
+    index = {}
+    for dim,dimUnits in units.items():
+        base = bases[dim]
+        for uname,dg in dimUnits.items():
+            if uname in index:
+                raise unitError("dupUnitName", uname, index[uname][0], dim)
+            index[uname] = (dim, dg, base)
+    units = MappingProxyType({dim:MappingProxyType(dimUnits) for dim,dimUnits in units.items()})
+    return units, MappingProxyType(index)
+
+def setUnitTables(src):
+    UnitManager.units, UnitManager.unitIndex = genUnitTables(src)
+    UnitManager.unitDigest = None
+
+def updateUnitTables():
+    setUnitTables(available_units)
+
+def registerUnit(dim, unit, factor=None):
+    # without factor a new dimension with base unit, expanded with every
+    # prefix; with factor a scaled unit of the existing dim, factor base units
+    dims = {**available_units['physical_quantity'], **available_units['unprefixed_quantity']}
+    if factor is None:
+        if dim in dims:
+            raise unitError("dupDimName", dim)
+        src = {**available_units, 'physical_quantity':{**available_units['physical_quantity'], dim:unit}}
+        setUnitTables(src)
+        available_units['physical_quantity'][dim] = unit
+        return
+    if dim not in dims:
+        raise unitError("unDefDimName", dim)
+    custom = available_units['custom_unit']
+    custom = {**custom, dim:{**custom.get(dim, {}), unit:float(factor)}}
+    setUnitTables({**available_units, 'custom_unit':custom})
+    available_units['custom_unit'] = custom
+
+def registerPrefix(prefix, factor):
+    if prefix in available_units['unit_prefix']:
+        raise unitError("dupPrefix", prefix)
+    src = {**available_units, 'unit_prefix':{**available_units['unit_prefix'], prefix:factor}}
+    setUnitTables(src)
+    available_units['unit_prefix'][prefix] = factor
+
 class UnitManager():
-    def __init__(self):
-        self.units = {}
-        self.genUnits()
+    # generated once per process and shared read-only by every instance,
+    # extend through registerUnit/registerPrefix
+    units = MappingProxyType({})
+    unitIndex = MappingProxyType({})
+    unitDigest = None
+    # an instrument.Instrumentation set here (or per instance) counts lookups
+    # and conversions
+    instrument = None
 
     def genUnits(self):
-        self.units = {}
-        for dim,pq in available_units['physical_quantity'].items():
-            self.units[dim] = {}
-            pq_arr = re.split(r'[/*]', pq)
-            pq_num = re.findall(r'\*(\w*)', pq)
-            pq_num.append(pq_arr[0])
-            pq_denom = re.findall(r'\/(\w*)', pq)
-            for i,sub_pq in enumerate(pq_arr):
-                for pf, dg in available_units['unit_prefix'].items():
-                    for j,tmp in enumerate(pq_arr):
-                        join_char = '*' if tmp in pq_num else '/'
-                        tmp = tmp if j!=i else f'{pf}{tmp}'
-                        vname = tmp if j==0 else vname+join_char+tmp
-                    dg = dg if sub_pq in pq_num else 1/dg
-                    self.units[dim][vname] = dg
+        updateUnitTables()
+
+    def getUnitDigest(self):
+        # digest of the index, for keys of anything parsed against these
+        # tables; computed on first use so importing needs no hashlib
+        if UnitManager.unitDigest is None:
+            import hashlib
+            UnitManager.unitDigest = hashlib.sha256(repr(sorted(self.unitIndex.items())).encode()).hexdigest()
+        return UnitManager.unitDigest
 
     def getUnits(self, dim):
         return self.units[dim].copy()
@@ -66,27 +170,24 @@ class UnitManager():
         return list(self.units[dim].keys())
 
     def isValid(self, uname):
-        return uname in self.getAllUnits().keys()
+        if self.instrument is not None:
+            self.instrument.count("unitLookups")
+        return uname in self.unitIndex
 
     def getUnitVal(self, uname):
-        if self.isValid(uname):
-            return self.getAllUnits()[uname]
-        else:
-            return None
+        if self.instrument is not None:
+            self.instrument.count("unitLookups")
+        entry = self.unitIndex.get(uname)
+        return entry[1] if entry else None
 
     def getAllUnits(self):
-        all_units = {}
-        for units in self.units.values():
-            all_units.update(units)
-        return all_units.copy()
+        return {uname:entry[1] for uname,entry in self.unitIndex.items()}
 
     def getDimName(self, uname):
-        if self.isValid(uname):
-            for dim,units in self.units.items():
-                if uname in list(units.keys()):
-                    return dim
-        else:
-            return None
+        if self.instrument is not None:
+            self.instrument.count("unitLookups")
+        entry = self.unitIndex.get(uname)
+        return entry[0] if entry else None
 
     def getRelatives(self, uname):
         dim = self.getDimName(uname)
@@ -96,13 +197,14 @@ class UnitManager():
             return None
 
     def getBaseUnit(self, uname):
-        dim = self.getDimName(uname)
-        if dim:
-            return available_units['physical_quantity'][dim]
-        else:
-            return None
+        if self.instrument is not None:
+            self.instrument.count("unitLookups")
+        entry = self.unitIndex.get(uname)
+        return entry[2] if entry else None
 
     def convUnit(self, val, unit1=None, unit2=None):
+        if self.instrument is not None:
+            self.instrument.count("conversions")
         dig1 = self.getUnitVal(unit1) if unit1 else 1
         dig2 = self.getUnitVal(unit2) if unit2 else 1
         return val*dig1/dig2
@@ -120,27 +222,52 @@ class UnitManager():
         retArr[2][2] = rs
         return retArr
 
+    def convUnitArr(self, val, unit1=None, unit2=None, out=None):
+        if self.instrument is not None:
+            self.instrument.count("conversions", np.size(val))
+        dig1 = self.getUnitVal(unit1) if unit1 else 1
+        dig2 = self.getUnitVal(unit2) if unit2 else 1
+        out = np.multiply(val, dig1, out=out, dtype=float)
+        out /= dig2
+        return out
+
+    def getResistivityDim(self, dim):
+        return dim if dim in resistivity_dims else resistivity_dims[0]
+
     def transResistivity(self, t, val, dim1, dim2):
-        row = 0
-        if dim1=="resistivity":
-            row = 0
-        elif dim1=="conductivity":
-            row = 1
-        elif dim1=="sheet_resistance":
-            row = 2
-
-        col = 0
-        if dim2=="resistivity":
-            col = 0
-        elif dim2=="conductivity":
-            col = 1
-        elif dim2=="sheet_resistance":
-            col = 2
-
-        arr = self.calcResistivity(t,val,val,val)
-        return arr[row][col]
+        return self.transResistivityArr(t, val, dim1, dim2)[()]
+
+    def genResistivityPlan(self, unit1, unit2, tUnit=None):
+        # fold unit scaling and dimension change into f(t,val) = k * val**a * t**b
+        if self.instrument is not None:
+            self.instrument.count("plansCompiled")
+        dig1 = self.getUnitVal(unit1)
+        dig2 = self.getUnitVal(unit2)
+        digT = self.getUnitVal(tUnit) if tUnit else 1
+        dims = (self.getResistivityDim(self.getDimName(unit1)), self.getResistivityDim(self.getDimName(unit2)))
+        a,b = resistivity_exps[dims]
+        k = dig1**a * digT**b / dig2
+        if b==0:
+            return (lambda t,v: k*v) if a==1 else (lambda t,v: k/v)
+        elif b==1:
+            return lambda t,v: k*t*v
+        else:
+            return (lambda t,v: k*v/t) if a==1 else (lambda t,v: k/(t*v))
+
+    def transResistivityArr(self, t, val, dim1, dim2, out=None):
+        t = np.asarray(t, dtype=float)
+        val = np.asarray(val, dtype=float)
+        if out is None:
+            out = np.empty(np.broadcast_shapes(t.shape, val.shape))
+        if self.instrument is not None:
+            self.instrument.count("conversions", out.size)
+        func = trans_resistivity[(self.getResistivityDim(dim1), self.getResistivityDim(dim2))]
+        return func(t, val, out)
 
+class unitError(Exception):
+    pass
 
+updateUnitTables()
 
 if __name__=='__main__':
     um = UnitManager()